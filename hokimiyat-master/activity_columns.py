@@ -0,0 +1,127 @@
+import time
+from datetime import datetime
+from message_records import MessageRecord
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without NumPy the analyzer uses its per-message loop
+    np = None
+
+def empty_activity():
+    return {'most_active_hour': 0, 'top_participants': [], 'total_participants': 0, 'avg_message_length': 0}
+
+class ActivityColumns:
+    """
+    Columnar message window of one or more groups: NumPy arrays of epoch
+    times, sender codes, text lengths and group codes. Activity statistics
+    (GroupAnalyzer.analyze_group_activity) are computed for all groups at
+    once with bincount/unique instead of a Python loop per message.
+    Senders are coded by display name, as the per-message analysis counts them.
+    """
+    
+    def __init__(self, epochs, senders, lengths, groups, sender_names, group_names):
+        self.epochs = epochs  # float64 epoch seconds
+        self.senders = senders  # int64 index into sender_names
+        self.lengths = lengths  # int64 text lengths
+        self.groups = groups  # int64 index into group_names
+        self.sender_names = sender_names
+        self.group_names = group_names
+    
+    @classmethod
+    def from_groups(cls, groups):
+        """Build the columns from {group_name: messages} (MessageRecords or message dicts)"""
+        epochs, senders, lengths, counts = [], [], [], []
+        sender_codes = {}
+        for messages in groups.values():
+            start = len(epochs)
+            if all(isinstance(msg, MessageRecord) for msg in messages):
+                epochs.extend([msg.epoch for msg in messages])
+                senders.extend([sender_codes.setdefault(msg.sender, len(sender_codes)) for msg in messages])
+                lengths.extend([len(msg.text) for msg in messages])
+                counts.append(len(epochs) - start)
+                continue
+            for msg in messages:
+                if isinstance(msg, MessageRecord):
+                    epoch, sender, text = msg.epoch, msg.sender, msg.text
+                else:
+                    try:
+                        epoch = msg.get('epoch')
+                        if epoch is None:
+                            epoch = datetime.fromisoformat(msg['timestamp']).timestamp()
+                    except ValueError:
+                        continue  # Skipped like in the per-message analysis
+                    sender, text = msg['sender'], msg['text']
+                epochs.append(epoch)
+                code = sender_codes.get(sender)
+                if code is None:
+                    code = sender_codes[sender] = len(sender_codes)
+                senders.append(code)
+                lengths.append(len(text))
+            counts.append(len(epochs) - start)
+        
+        return cls(
+            np.array(epochs, dtype=np.float64),
+            np.array(senders, dtype=np.int64),
+            np.array(lengths, dtype=np.int64),
+            np.repeat(np.arange(len(counts), dtype=np.int64), counts),
+            list(sender_codes),
+            list(groups),
+        )
+    
+    def __len__(self):
+        return len(self.epochs)
+    
+    def local_hours(self):
+        """Local hour of day of every message (UTC offsets looked up once per distinct hour)"""
+        buckets, inverse = np.unique(self.epochs // 3600, return_inverse=True)
+        offsets = np.array([time.localtime(bucket * 3600).tm_gmtoff for bucket in buckets.tolist()], dtype=np.float64)
+        return (((self.epochs + offsets[inverse.reshape(-1)]) // 3600) % 24).astype(np.int64)
+    
+    def ranked(self, keys, base):
+        """
+        Distinct (group, value) keys ranked per group by count, highest first;
+        ties keep first-seen order, like sorting a dict that counted them.
+        Returns (key groups, values, counts) in ranked order.
+        """
+        unique_keys, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        key_groups = unique_keys // base
+        order = np.lexsort((first, -counts, key_groups))
+        return key_groups[order], unique_keys[order] % base, counts[order]
+    
+    def activity(self, top=5):
+        """{group_name: activity dict}, the same as analyze_group_activity per group"""
+        results = {name: empty_activity() for name in self.group_names}
+        if not len(self):
+            return results
+        
+        message_counts = np.bincount(self.groups, minlength=len(self.group_names))
+        length_sums = np.bincount(self.groups, weights=self.lengths, minlength=len(self.group_names))
+        
+        # Hourly histogram per group; the most active hour is the first of each group's ranking
+        hour_groups, hours, _ = self.ranked(self.groups * 24 + self.local_hours(), 24)
+        leading = np.ones(len(hour_groups), dtype=bool)
+        leading[1:] = hour_groups[1:] != hour_groups[:-1]
+        
+        # Participants per group, ranked by message count
+        base = max(len(self.sender_names), 1)
+        sender_groups, senders, sender_counts = self.ranked(self.groups * base + self.senders, base)
+        participant_totals = np.bincount(sender_groups, minlength=len(self.group_names))
+        starts = np.searchsorted(sender_groups, np.arange(len(self.group_names)))
+        
+        most_active = dict(zip(hour_groups[leading].tolist(), hours[leading].tolist()))
+        senders = senders.tolist()
+        sender_counts = sender_counts.tolist()
+        for code, name in enumerate(self.group_names):
+            count = int(message_counts[code])
+            if not count:
+                continue
+            start = int(starts[code])
+            end = start + min(top, int(participant_totals[code]))
+            results[name] = {
+                'most_active_hour': most_active[code],
+                'top_participants': [(self.sender_names[sender], sender_count) for sender, sender_count
+                                     in zip(senders[start:end], sender_counts[start:end])],
+                'total_participants': int(participant_totals[code]),
+                'avg_message_length': float(length_sums[code]) / count,
+            }
+        return results
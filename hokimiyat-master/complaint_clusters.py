@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from near_duplicates import MinHash, add_recent
+from text_normalizer import normalized
+
+logger = logging.getLogger(__name__)
+
+# Words that say nothing about what or where the problem is
+STOPWORDS = {
+    'va', 'bu', 'shu', 'u', 'bilan', 'uchun', 'ham', 'juda', 'iltimos', 'yana', 'hali', 'endi', 'bor', "yo'q",
+    'edi', 'ekan', 'emas', 'kerak', 'qachon', 'nega', 'assalomu', 'alaykum', 'rahmat', 'bizning', 'bizda',
+    'men', 'biz', 'siz', 'ular', 'hamma', 'har', 'kun', 'bugun', 'kecha', 'i', 'v', 'na', 'ne', 'eto',
+}
+
+# A word before one of these names a place ("Navoiy ko'chasi", "12-uy", "Gulzor mahallasi")
+LOCATION_MARKERS = ("ko'cha", 'mahalla', 'mfy', 'massiv', 'kvartal', 'uy', 'dom', 'ulitsa', 'prospekt', 'tor',
+                    'bekat', 'maktab', "bog'cha", 'poliklinika')
+
+def stem(token):
+    """Crude stem: Uzbek adds suffixes, so the first letters identify the word"""
+    return token[:6]
+
+class ComplaintClusters:
+    """
+    Online clustering of complaints from all groups into tracked issues.
+    Each complaint joins the most similar cluster or starts a new one.
+    Candidates come from MinHash LSH buckets over word stems and from shared
+    location mentions; the same wording at a different place, or a cluster
+    with no topic in common, is kept apart. Clusters keep stable ids, counts,
+    topics, groups and first/last-seen times, and are never re-clustered.
+    Buckets and location lists keep only their most recently updated clusters.
+    """
+    
+    def __init__(self, threshold=0.4, location_bonus=0.3, num_hashes=32, bands=16, max_clusters=10000,
+                 max_candidates=8, max_bucket=64):
+        self.threshold = threshold
+        self.location_bonus = location_bonus  # Added to the similarity when a place is shared
+        self.minhash = MinHash(num_hashes, bands)  # 2 rows per band: candidates from ~30% similarity
+        self.max_clusters = max_clusters
+        self.max_candidates = max_candidates
+        self.max_bucket = max_bucket
+        
+        self.clusters = OrderedDict()  # cluster id -> cluster, least recently updated first
+        self.buckets = [defaultdict(dict) for _ in range(bands)]  # band key -> {cluster id: None}, oldest first
+        self.locations = defaultdict(dict)  # location -> {cluster id: None}, oldest first
+        self.next_id = 1
+        self.dirty = False
+        self.stats = {'complaints': 0, 'merged': 0}
+    
+    def features(self, text):
+        """
+        (hashed word stems, location mentions) of a complaint. Place names are
+        left out of the words: they are compared through the locations, so two
+        problems on the same street do not look alike because of its name.
+        """
+        tokens = normalized(text).split()
+        locations = set()
+        place_tokens = set()
+        for i in range(1, len(tokens)):
+            previous, token = tokens[i - 1], tokens[i]
+            if previous in STOPWORDS:
+                continue
+            for marker in LOCATION_MARKERS:
+                if token.startswith(marker):
+                    locations.add(f"{stem(previous)} {marker}")
+                    place_tokens.update((i - 1, i))
+                    break
+        words = {zlib.crc32(stem(token).encode('utf-8')) for i, token in enumerate(tokens)
+                 if len(token) > 2 and token not in STOPWORDS and i not in place_tokens}
+        return words, locations
+    
+    def sketch(self, text):
+        """(MinHash signature, locations) of a complaint; uses no cluster state, so it can run in another process"""
+        words, locations = self.features(text)
+        return (self.minhash.signature(words) if words else None), locations
+    
+    def add(self, message, topics=(), priority=1, sketch=None):
+        """
+        Assign a complaint (MessageRecord or message dict) to a cluster; returns the cluster id.
+        `topics` are the complaint's topics (GroupAnalyzer.classify_message), the first one naming a new cluster.
+        `sketch` is the complaint's sketch() when it was already computed (by a shard worker).
+        """
+        self.stats['complaints'] += 1
+        self.dirty = True
+        signature, locations = sketch if sketch is not None else self.sketch(message)
+        band_keys = self.minhash.band_keys(signature) if signature else []
+        
+        candidates = Counter()
+        for band, band_key in enumerate(band_keys):
+            candidates.update(self.buckets[band].get(band_key, {}).keys())
+        for location in locations:
+            candidates.update(self.locations.get(location, {}).keys())
+        
+        best_id, best_score = None, 0.0
+        for cluster_id, _ in candidates.most_common(self.max_candidates):
+            cluster = self.clusters[cluster_id]
+            shared = locations & cluster['locations']
+            if locations and cluster['locations'] and not shared:
+                continue  # Same problem, different place
+            if topics and cluster['topics'] and cluster['topics'].isdisjoint(topics):
+                continue  # Different kind of problem
+            score = self.minhash.similarity(signature, cluster['signature']) if signature and cluster['signature'] else 0.0
+            if shared:
+                score += self.location_bonus
+            if score > best_score:
+                best_id, best_score = cluster_id, score
+        
+        epoch = message.get('epoch') or time.time()
+        group_name = message.get('group_name')
+        if best_id is not None and best_score >= self.threshold:
+            cluster = self.clusters[best_id]
+            cluster['count'] += 1
+            cluster['first_seen'] = min(cluster['first_seen'], epoch)
+            cluster['last_seen'] = max(cluster['last_seen'], epoch)
+            cluster['priority'] = max(cluster['priority'], priority)
+            if group_name and group_name not in cluster['groups']:
+                cluster['groups'].append(group_name)
+            cluster['topics'].update(topics)
+            cluster['locations'].update(locations)
+            self.clusters.move_to_end(best_id)
+            self.index(cluster)
+            self.stats['merged'] += 1
+            return best_id
+        
+        cluster_id = self.next_id
+        self.next_id += 1
+        self.insert({
+            'id': cluster_id,
+            'category': topics[0] if topics else 'Boshqa',
+            'topics': set(topics),
+            'text': message.get('text') or '',  # First complaint represents the cluster
+            'signature': signature,
+            'locations': locations,
+            'groups': [group_name] if group_name else [],
+            'count': 1,
+            'priority': priority,
+            'first_seen': epoch,
+            'last_seen': epoch,
+        })
+        return cluster_id
+    
+    def insert(self, cluster):
+        cluster_id = cluster['id']
+        self.clusters[cluster_id] = cluster
+        self.index(cluster)
+        while len(self.clusters) > self.max_clusters:
+            self.evict_oldest()
+    
+    def index(self, cluster):
+        """Add (or refresh, as the newest) a cluster in its buckets and location lists"""
+        cluster_id = cluster['id']
+        if cluster['signature']:
+            for band, band_key in enumerate(self.minhash.band_keys(cluster['signature'])):
+                add_recent(self.buckets[band][band_key], cluster_id, self.max_bucket)
+        for location in cluster['locations']:
+            add_recent(self.locations[location], cluster_id, self.max_bucket)
+    
+    def evict_oldest(self):
+        """Drop the least recently updated cluster to keep memory bounded"""
+        cluster_id, cluster = self.clusters.popitem(last=False)
+        if cluster['signature']:
+            for band, band_key in enumerate(self.minhash.band_keys(cluster['signature'])):
+                bucket = self.buckets[band].get(band_key)
+                if bucket:
+                    bucket.pop(cluster_id, None)
+                    if not bucket:
+                        del self.buckets[band][band_key]
+        for location in cluster['locations']:
+            listed = self.locations.get(location)
+            if listed is not None:
+                listed.pop(cluster_id, None)
+                if not listed:
+                    del self.locations[location]
+    
+    def get(self, cluster_id):
+        return self.clusters.get(cluster_id)
+    
+    def summary(self, cluster_id):
+        """Copy of a cluster's report fields (safe to read from another thread), or None"""
+        cluster = self.clusters.get(cluster_id)
+        if cluster is None:
+            return None
+        summary = {key: cluster[key] for key in ('id', 'category', 'text', 'count', 'priority', 'first_seen', 'last_seen')}
+        summary['groups'] = list(cluster['groups'])
+        return summary
+    
+    def top(self, k=5, since=None, min_count=2):
+        """The k largest clusters updated since `since` (epoch seconds), as summaries"""
+        recent = [cluster for cluster in list(self.clusters.values())
+                  if cluster['count'] >= min_count and (since is None or cluster['last_seen'] >= since)]
+        recent.sort(key=lambda cluster: (cluster['count'], cluster['priority']), reverse=True)
+        return [self.summary(cluster['id']) for cluster in recent[:k]]
+    
+    def save(self, path):
+        """Persist the clusters (atomically) if they changed since the last save"""
+        if not self.dirty:
+            return
+        data = {
+            'next_id': self.next_id,
+            'clusters': [dict(cluster, signature=list(cluster['signature']) if cluster['signature'] else None,
+                              locations=sorted(cluster['locations']), topics=sorted(cluster['topics']))
+                         for cluster in self.clusters.values()],
+        }
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+            self.dirty = False
+        except Exception as e:
+            logger.warning(f"Could not save complaint clusters: {str(e)}")
+    
+    def load(self, path):
+        """Restore clusters saved by a previous run, keeping their ids"""
+        try:
+            if not os.path.exists(path):
+                return
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for cluster in data.get('clusters', []):
+                cluster['signature'] = tuple(cluster['signature']) if cluster['signature'] else None
+                cluster['locations'] = set(cluster['locations'])
+                cluster['topics'] = set(cluster.get('topics', ()))
+                self.insert(cluster)
+            self.next_id = max(data.get('next_id', 1), max(self.clusters, default=0) + 1)
+            logger.info(f"Loaded {len(self.clusters)} complaint clusters")
+        except Exception as e:
+            logger.warning(f"Could not load complaint clusters: {str(e)}")
+    
+    def metrics(self):
+        return dict(self.stats, clusters=len(self.clusters))
@@ -1,7 +1,175 @@
 import os
+import copy
+import json
+import multiprocessing
+import sys
+import threading
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
 import datetime
-import google.generativeai as genai
+from text_normalizer import KeywordSet, join_normalized, normalized
+
+# Explains the tracked-issue annotations format_conversation adds to prompt lines
+CLUSTER_NOTE = ("Bir xil muammo haqidagi takroriy murojaatlar bitta qatorga jamlangan; \"muammo #N: K ta murojaat\" "
+                "izohi uni necha marta va qaysi guruhlarda yozishganini ko'rsatadi. Uni bitta muammo deb qaytaring.")
+
+# Issue types and priorities the AI is allowed to report
+ISSUE_TYPES = ['Transport', 'Kommunal', "Ta'lim", 'Tibbiyot', 'Xavfsizlik', 'Atrof-muhit', 'Infratuzilma', 'Ijtimoiy', 'Boshqa']
+ISSUE_PRIORITIES = ['Yuqori', "O'rtacha", 'Past']
+PRIORITY_RANK = {'Yuqori': 3, "O'rtacha": 2, 'Past': 1}
+
+# Guards the one-time Gemini setup when the first AI calls run concurrently
+MODEL_LOCK = threading.Lock()
+
+# Response schemas for Gemini structured output
+ISSUE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'type': {'type': 'string', 'enum': ISSUE_TYPES},
+        'description': {'type': 'string'},
+        'author': {'type': 'string'},
+        'timestamp': {'type': 'string'},
+        'details': {'type': 'string'},
+        'priority': {'type': 'string', 'enum': ISSUE_PRIORITIES},
+    },
+    'required': ['type', 'description', 'author', 'timestamp', 'details', 'priority'],
+}
+
+GROUP_ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'issues': {'type': 'array', 'items': ISSUE_SCHEMA},
+        'recommendations': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['issues', 'recommendations'],
+}
+
+BATCH_ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'groups': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'group_name': {'type': 'string'},
+                    'issues': {'type': 'array', 'items': ISSUE_SCHEMA},
+                    'recommendations': {'type': 'array', 'items': {'type': 'string'}},
+                },
+                'required': ['group_name', 'issues', 'recommendations'],
+            },
+        },
+    },
+    'required': ['groups'],
+}
+
+@dataclass
+class Issue:
+    """A single issue reported by the AI analysis"""
+    id: int
+    type: str
+    description: str
+    author: str
+    timestamp: str
+    details: str
+    priority: str
+    status: str = 'Yangi'
+    source: str = 'AI Analysis'
+    message_id: int = None
+    chat_id: int = None
+    
+    @classmethod
+    def from_dict(cls, data, issue_id):
+        """Validate one issue object from the AI response"""
+        if not isinstance(data, dict):
+            raise ValueError(f"Issue must be an object, got {type(data).__name__}")
+        fields = {name: str(data.get(name) or '').strip()
+                  for name in ('type', 'description', 'author', 'timestamp', 'details', 'priority')}
+        if not fields['description'] and not fields['details']:
+            raise ValueError("Issue has no description")
+        if fields['type'] not in ISSUE_TYPES:
+            fields['type'] = 'Boshqa'
+        if fields['priority'] not in ISSUE_PRIORITIES:
+            fields['priority'] = "O'rtacha"
+        return cls(id=issue_id, **fields)
+    
+    def to_dict(self):
+        return asdict(self)
+
+def message_time(msg):
+    """Message time as a datetime (MessageRecord epoch, or a dict's ISO timestamp)"""
+    epoch = msg.get('epoch')
+    if epoch is not None:
+        return datetime.datetime.fromtimestamp(epoch)
+    return datetime.datetime.fromisoformat(msg['timestamp'])
+
+def tokenize(text):
+    """Normalized word tokens of a text or message"""
+    return normalized(text).split()
+
+class MessageIndex:
+    """
+    Index over a message window for linking AI-reported issues back to their
+    source message. Exact matches go through a normalized-text fingerprint,
+    fuzzy matches through an inverted word index scored by containment.
+    """
+    
+    def __init__(self, messages, min_score=0.6, max_posting_ratio=0.2):
+        self.messages = messages
+        self.min_score = min_score
+        self.fingerprints = {}
+        self.postings = defaultdict(list)
+        self.sender_tokens = defaultdict(set)
+        
+        for idx, msg in enumerate(messages):
+            tokens = tokenize(msg)
+            if not tokens:
+                continue
+            self.fingerprints.setdefault(" ".join(tokens), idx)
+            for token in set(tokens):
+                self.postings[token].append(idx)
+            for token in tokenize(msg.get('sender', '')):
+                self.sender_tokens[token].add(idx)
+        
+        # Words present in a large share of messages carry no signal and have huge posting lists
+        self.max_postings = max(10, int(len(messages) * max_posting_ratio))
+    
+    def find(self, author, details):
+        """Return the best-matching message for an issue, or None"""
+        query = tokenize(details)
+        if not query:
+            return None
+        
+        by_author = set()
+        for token in tokenize(author):
+            by_author |= self.sender_tokens.get(token, set())
+        
+        exact = self.fingerprints.get(" ".join(query))
+        if exact is not None:
+            return self.messages[exact]
+        
+        query_tokens = [t for t in set(query) if len(self.postings.get(t, ())) <= self.max_postings]
+        if not query_tokens:
+            return None
+        
+        hits = defaultdict(int)
+        for token in query_tokens:
+            for idx in self.postings.get(token, ()):
+                hits[idx] += 1
+        
+        best_idx, best_score = None, 0.0
+        for idx, count in hits.items():
+            score = count / len(query_tokens)
+            if idx in by_author:
+                score += 0.2  # Same author makes a partial text match much more likely
+            # Prefer the most recent message on ties
+            if score > best_score or (score == best_score and best_idx is not None and idx > best_idx):
+                best_idx, best_score = idx, score
+        
+        if best_idx is None or best_score < self.min_score:
+            return None
+        return self.messages[best_idx]
 
 class GroupAnalyzer:
     """
@@ -9,36 +177,36 @@ class GroupAnalyzer:
     """
     
     def __init__(self):
-        # Configure Gemini AI
-        api_key = os.getenv('GEMINI_API_KEY')
-        if api_key:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel('gemini-pro')
-        else:
-            self.model = None
+        # Gemini AI is configured on the first AI call (see model): importing the SDK is slow
+        self.api_key = os.getenv('GEMINI_API_KEY')
+        self.model_name = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+        self._model = None
+        if not self.api_key:
             print("Warning: GEMINI_API_KEY not found. Using fallback analysis.")
         
-        # Topic keywords for different categories (fallback method)
-        self.topic_keywords = {
-            'transport': ['taxi', 'transport', 'автобус', 'маршрутка', 'такси', 'транспорт', 'bus', 'car', 'vehicle', 'taksi', 'marshrutka', 'avtobus', 'poyezd', 'samolyot', 'avtotransport'],
-            'utilities': ['water', 'electricity', 'gas', 'свет', 'вода', 'газ', 'электричество', 'utility', 'kommunal', 'svet', 'voda', 'gaz', 'elektr', 'issiq suv', 'sovuq suv', 'kanalizatsiya'],
-            'education': ['school', 'maktab', 'училище', 'мактаб', 'education', 'ta\'lim', 'o\'qish', 'universitet', 'kollej', 'litsey', 'akademiyа', 'dars', 'o\'qituvchi', 'talaba'],
+        # Topic keywords for different categories (fallback method).
+        # Keywords are matched on normalized text (Latin script, unified apostrophes),
+        # so a Latin entry also covers its Cyrillic and apostrophe variants
+        self.topic_keywords = {topic: KeywordSet(keywords) for topic, keywords in {
+            'transport': ['taxi', 'transport', 'bus', 'car', 'vehicle', 'taksi', 'marshrutka', 'avtobus', 'poyezd', 'samolyot', 'avtotransport'],
+            'utilities': ['water', 'electricity', 'gas', 'электричество', 'utility', 'kommunal', 'svet', 'voda', 'gaz', 'elektr', 'issiq suv', 'sovuq suv', 'kanalizatsiya'],
+            'education': ['school', 'maktab', 'училище', 'education', 'ta\'lim', 'o\'qish', 'universitet', 'kollej', 'litsey', 'akademiyа', 'dars', 'o\'qituvchi', 'talaba'],
             'health': ['doctor', 'hospital', 'doktor', 'больница', 'дармон', 'health', 'salomat', 'dori', 'shifokor', 'klinika', 'davolash', 'tibbiyot', 'dori-darmon'],
             'finance': ['money', 'pul', 'денги', 'bank', 'kredit', 'loan', 'finance', 'valyuta', 'kurs', 'investitsiya', 'byudjet', 'solik', 'moliya'],
             'security': ['police', 'militsiya', 'полиция', 'security', 'xavfsizlik', 'havf', 'qo\'riq', 'himoya', 'uy xavfsizligi', 'kriminal', 'xavfsizlik kuchi'],
-            'environment': ['nature', 'park', 'tree', 'atmosphere', 'tabiat', 'park', 'daraxt', 'havo', 'ekologiya', 'chuqur', 'iflos', 'tazarrurat', 'recycling', 'atmosfera'],
+            'environment': ['nature', 'park', 'tree', 'atmosphere', 'tabiat', 'daraxt', 'havo', 'ekologiya', 'chuqur', 'iflos', 'tazarrurat', 'recycling', 'atmosfera'],
             'infrastructure': ['yo\'l', 'ko\'cha', 'tamirlash', 'qurilish', 'infratuzilma', 'infrastructure', 'road', 'street', 'repair', 'construction'],
             'social': ['yordam', 'help', 'qo\'llab-quvvatlash', 'support', 'nopul', 'pul', 'pul yordami', 'social', 'ijtimoiy', 'muhtoj', 'yetim', 'nogiron']
-        }
+        }.items()}
         
         # Sentiment words (fallback method)
-        self.positive_words = ['good', 'great', 'yaxshi', 'zo\'r', 'отлично', 'хорошо', 'happy', 'joy', 'quvonch', 'yengillik', 'mamnuniyat', 'qoniqish', 'muvaffaqiyat', 'yutuq', 'tabriklayman', 'mukammal']
-        self.negative_words = ['bad', 'terrible', 'yomon', 'ужасно', 'плохо', 'sad', 'grief', 'hafa', 'g\'am', 'problem', 'muammo', 'shikoyat', 'norozilik', 'xato', 'kamchilik', 'nosoz', 'halokat']
+        self.positive_words = KeywordSet(['good', 'great', 'yaxshi', 'zo\'r', 'отлично', 'хорошо', 'happy', 'joy', 'quvonch', 'yengillik', 'mamnuniyat', 'qoniqish', 'muvaffaqiyat', 'yutuq', 'tabriklayman', 'mukammal'])
+        self.negative_words = KeywordSet(['bad', 'terrible', 'yomon', 'ужасно', 'плохо', 'sad', 'grief', 'hafa', 'g\'am', 'problem', 'muammo', 'shikoyat', 'norozilik', 'xato', 'kamchilik', 'nosoz', 'halokat'])
         
         # Enhanced complaint indicators with more specific keywords
-        self.complaint_keywords = [
-            'shikoyat', 'жалоба', 'шикоят', 'muammo', 'проблема', 'issue', 'problem',
-            'yomon', 'yomonlashgan', 'buzilgan', 'ishlamayapti', 'ishlamayapti', 'yaxshi emas',
+        self.complaint_keywords = KeywordSet([
+            'shikoyat', 'жалоба', 'muammo', 'проблема', 'issue', 'problem',
+            'yomon', 'yomonlashgan', 'buzilgan', 'ishlamayapti', 'yaxshi emas',
             'qoniqarsiz', 'qoniqarmiz', 'noroziman', 'norozilik', 'shikoyat qilmoq',
             'yordam bering', 'yordam kerak', 'muammo bor', 'muammo yuz berdi',
             'xatolik', 'xato', 'kamchilik', 'kamchilik bor', 'yaxshilash kerak',
@@ -46,11 +214,113 @@ class GroupAnalyzer:
             'ogohlantirish', 'ogohlantiring', 'qayta ishlash kerak', 'qayta ko\'rib chiqish',
             'ta\'mirlash kerak', 'ta\'mirlashni so\'rayman', 'ta\'mirlash zarur', 'ta\'mirlanmagan',
             'qurilish kerak', 'qurilishni so\'rayman', 'qurilish zarur', 'qurilish ishlari olib borilmagan'
-        ]
+        ])
+        
+        # Words that mark a complaint as urgent
+        self.priority_terms = KeywordSet(['zudlik', 'zarur', 'hal qilish', 'tezda', 'shoshilinch', 'xavfli'])
+        
+        # Complaint urgency levels shown in the government report (3 = critical)
+        self.critical_terms = KeywordSet(['zudlik', 'zarur', 'shoshilinch', 'xavfli'])
+        self.important_terms = KeywordSet(['muhim', 'tezda', 'hal qilish'])
+        
+        # Aggressive behaviour indicators
+        self.aggressive_keywords = KeywordSet(['jinni', 'xun', 'o\'ldir', 'ur', 'tajovuz', 'hujum', 'tirnamay', 'soqov', 'g\'azab'])
         
         # Track issues and their details
         self.issues = []
         self.issue_categories = set()
+        self.issues_by_group = {}
+        
+        # Batched AI analysis settings
+        self.max_prompt_messages = 100  # Last 100 messages for better context
+        self.token_budget = int(os.getenv('AI_TOKEN_BUDGET', '8000'))
+        self.max_concurrent_requests = int(os.getenv('AI_MAX_CONCURRENCY', '4'))
+        
+        # Escalation thresholds: only groups crossing one of them are sent to the AI
+        self.min_complaints_for_ai = int(os.getenv('AI_MIN_COMPLAINTS', '2'))
+        self.min_sentiment_delta_for_ai = float(os.getenv('AI_MIN_SENTIMENT_DELTA', '0.3'))
+        self.min_new_messages_for_ai = int(os.getenv('AI_MIN_NEW_MESSAGES', '50'))
+        self.last_ai_analysis = {}  # group_name -> {'timestamp', 'sentiment'}
+        self.escalation_stats = {'escalated': 0, 'skipped': 0}
+        
+        # City-wide fallback analysis fans groups out to a process pool
+        self.fallback_workers = int(os.getenv('FALLBACK_WORKERS', '0'))  # 0 = one per CPU
+        self.fallback_pool_min_groups = 20  # Fewer groups are analyzed in-process
+        self.fallback_pool = None
+        self.fallback_pool_workers = 0  # Size the pool was created with
+        
+        # Optional persistent history (message_store.MessageStore), set by the monitor
+        self.message_store = None
+        
+        # Optional complaint clusters (complaint_clusters.ComplaintClusters), set by the monitor
+        self.complaint_clusters = None
+    
+    def fetch_messages(self, group_name=None, since=None, until=None, keyword=None, limit=1000):
+        """
+        Query stored message history by group, time range and keyword.
+        Returns messages in the same format the analysis methods take.
+        """
+        if self.message_store is None:
+            return []
+        self.message_store.flush()
+        return self.message_store.query(group_name=group_name, since=since, until=until,
+                                        keyword=keyword, limit=limit)
+    
+    def estimate_tokens(self, text):
+        """
+        Rough token estimate for a prompt fragment.
+        Uzbek/Russian text tokenizes denser than English, so count ~3 chars per token.
+        """
+        return len(text) // 3 + 1
+    
+    def format_conversation(self, messages, seen=None):
+        """
+        Format the last messages of a group as prompt lines.
+        Near-duplicates (same 'dup_key') and complaints about the same tracked
+        issue (same 'cluster_id') are included once, with the issue's totals;
+        pass a shared `seen` set to also skip ones already included for another group.
+        """
+        if seen is None:
+            seen = set()
+        message_texts = []
+        for msg in messages[-self.max_prompt_messages:]:
+            dup_key = msg.get('dup_key')
+            if dup_key is not None:
+                if dup_key in seen:
+                    continue
+                seen.add(dup_key)
+            cluster_id = msg.get('cluster_id')
+            if cluster_id is not None:
+                if ('cluster', cluster_id) in seen:
+                    continue
+                seen.add(('cluster', cluster_id))
+            timestamp = message_time(msg).strftime('%Y-%m-%d %H:%M')
+            line = f"[{timestamp}] {msg['sender']}: {msg['text']}"
+            cluster = self.complaint_clusters.get(cluster_id) if self.complaint_clusters is not None else None
+            dup_groups = msg.get('dup_groups') or []
+            if cluster and cluster['count'] > 1:
+                groups = cluster['groups']
+                line += (f" (muammo #{cluster_id}: {cluster['count']} ta murojaat, "
+                         f"{len(groups)} ta guruhda: {', '.join(groups[:5])})")
+            elif len(dup_groups) > 1:
+                line += f" (takrorlangan, {len(dup_groups)} ta guruhda: {', '.join(dup_groups[:5])})"
+            message_texts.append(line)
+        return "\n".join(message_texts)
+    
+    @property
+    def model(self):
+        """Gemini model, created (and the SDK imported) on first use; None without an API key"""
+        if self._model is None and self.api_key:
+            with MODEL_LOCK:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+    
+    def json_config(self, schema):
+        """Generation config asking Gemini for JSON matching the given schema"""
+        return {'response_mime_type': 'application/json', 'response_schema': schema}
     
     def analyze_with_ai(self, group_name, messages):
         """
@@ -60,137 +330,452 @@ class GroupAnalyzer:
             return self.generate_fallback_report(group_name, messages)
             
         try:
-            # Prepare the messages for AI analysis with more context
-            message_texts = []
-            for msg in messages[-100:]:  # Last 100 messages for better context
-                timestamp = datetime.datetime.fromisoformat(msg['timestamp']).strftime('%Y-%m-%d %H:%M')
-                message_texts.append(f"[{timestamp}] {msg['sender']}: {msg['text']}")
-            
-            conversation = "\n".join(message_texts)
-            
-            # Create the prompt for AI analysis
-            prompt = f"""
-            Quyidagi Telegram guruhidagi muammolar va shikoyatlar haqida batafsil hisobot tayyorlang. 
+            return self.ai_report(group_name, messages)
+        except Exception as e:
+            print(f"AI analysis failed: {str(e)}")
+            return self.generate_fallback_report(group_name, messages)
+    
+    def ai_report(self, group_name, messages):
+        """Single-group AI report; raises when the Gemini call or its response fails"""
+        # Prepare the messages for AI analysis with more context
+        conversation = self.format_conversation(messages)
+        prompt = self.build_analysis_prompt(group_name, conversation)
+        
+        # Generate a structured response using Gemini
+        response = self.model.generate_content(prompt, generation_config=self.json_config(GROUP_ANALYSIS_SCHEMA))
+        analysis = self.parse_json_response(response.text)
+        
+        # Process and store the issues, then render the report locally
+        issues = self.process_issues_from_ai(analysis, messages)
+        self.issues_by_group[group_name] = issues
+        return self.render_ai_report(group_name, messages, issues, analysis.get('recommendations', []))
+    
+    def build_analysis_prompt(self, group_name, conversation):
+        """Create the prompt for single-group AI analysis"""
+        return f"""
+            Quyidagi Telegram guruhidagi muammolar va shikoyatlarni aniqlang.
             Guruh nomi: {group_name}
             
             Suhbat:
             {conversation}
             
-            Iltimos, quyidagi formatda aniq va tushunarli javob bering:
-            
-            🔍 MUAMMOLAR VA SHIKOYATLAR HISOBOTI
-            📅 Sana: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}
-            
-            📌 UMUMIY MA'LUMOT:
-            - Jami xabarlar soni: {len(messages)}
-            - Faol foydalanuvchilar soni: {len(set(msg['sender'] for msg in messages))}
-            
-            🚨 ANIQLANGAN MUAMMOLAR:
-            
-            [Har bir muammo uchun alohida bo'lim ochib, quyidagi ma'lumotlarni kiriting]
-            
-            🔹 MUAMMO #1:
-            - Muammo mazmuni: [Qisqacha tavsifi]
-            - Muammo turi: [Transport, Kommunal, Ta'lim, Tibbiyot, Xavfsizlik, Atrof-muhit, Infratuzilma, Ijtimoiy]
-            - Muallif: [Ismi]
-            - Vaqt: [Sana va vaxt]
-            - Batafsil: [To'liq matn]
-            - Muhimlik darajasi: [Yuqori/O'rtacha/Past]
-            - Holati: [Yangi/Ko'rib chiqilmoqda/Hal qilindi]
-            
-            📊 STATISTIKA:
-            - Jami muammolar soni: [soni]
-            - Muammolar bo'yicha taqsimot:
-              * Transport: X ta
-              * Kommunal: X ta
-              * Ta'lim: X ta
-              * Tibbiyot: X ta
-              * Xavfsizlik: X ta
-              * Atrof-muhit: X ta
-              * Infratuzilma: X ta
-              * Ijtimoiy: X ta
-            
-            🔝 ENG MUHIM 5 TA MUAMMO:
-            1. [Muammo tavsifi] - [Muallif] - [Vaqt]
-            2. [Muammo tavsifi] - [Muallif] - [Vaqt]
-            3. [Muammo tavsifi] - [Muallif] - [Vaqt]
-            4. [Muammo tavsifi] - [Muallif] - [Vaqt]
-            5. [Muammo tavsifi] - [Muallif] - [Vaqt]
-            
-            📋 TAVSIYALAR:
-            - [Tavsiya 1]
-            - [Tavsiya 2]
-            - [Tavsiya 3]
-            
-            Iltimos, har bir muammoni alohida va tushunarli qilib yozing. Muallif va vaxtni aniq ko'rsating.
+            Har bir muammo uchun: type (muammo turi), description (qisqacha tavsifi),
+            author (muallif ismi), timestamp (sana va vaqt), details (xabarning aynan matni),
+            priority (Yuqori/O'rtacha/Past). recommendations - 3 tagacha qisqa tavsiya.
+            Muammo bo'lmasa, issues bo'sh ro'yxat bo'lsin.
+            {CLUSTER_NOTE}
             """
+    
+    def pack_groups(self, groups):
+        """
+        Pack groups into AI requests under the token budget.
+        Returns (batches, large_groups): each batch is a list of
+        (group_name, messages, conversation) that fits in one prompt;
+        large groups do not fit alone and go through map-reduce.
+        """
+        prompt_overhead = self.estimate_tokens(self.build_batch_prompt([]))
+        budget = self.token_budget - prompt_overhead
+        
+        items = []
+        large_groups = []
+        seen = set()  # Forwarded copies go into the prompt once, city-wide
+        for group_name, messages in groups.items():
+            if not messages:
+                continue
+            conversation = self.format_conversation(messages, seen)
+            tokens = self.estimate_tokens(group_name) + self.estimate_tokens(conversation)
+            if tokens > budget:
+                large_groups.append((group_name, messages))
+            else:
+                items.append((tokens, group_name, messages, conversation))
+        
+        # First-fit decreasing: biggest groups first, each into the first batch with room
+        items.sort(key=lambda x: x[0], reverse=True)
+        batches = []
+        batch_tokens = []
+        for tokens, group_name, messages, conversation in items:
+            for i, used in enumerate(batch_tokens):
+                if used + tokens <= budget:
+                    batches[i].append((group_name, messages, conversation))
+                    batch_tokens[i] += tokens
+                    break
+            else:
+                batches.append([(group_name, messages, conversation)])
+                batch_tokens.append(tokens)
+        
+        return batches, large_groups
+    
+    def build_batch_prompt(self, batch):
+        """Create the prompt for analyzing several small groups in one request"""
+        sections = []
+        for group_name, messages, conversation in batch:
+            sections.append(f"=== GURUH: {group_name} ===\n{conversation}")
+        groups_text = "\n\n".join(sections)
+        
+        return f"""
+            Quyida bir nechta Telegram guruhlarining suhbatlari berilgan. Har bir guruhdagi
+            muammo va shikoyatlarni alohida aniqlang.
             
-            # Generate response using Gemini
-            response = self.model.generate_content(prompt)
-            
-            # Process and store the issues
-            self.process_issues_from_ai(response.text, messages)
+            {groups_text}
             
-            return response.text.strip()
+            Har bir guruh uchun group_name (aynan yuqoridagidek), issues va recommendations qaytaring.
+            Har bir muammo uchun: type (muammo turi), description (qisqacha tavsifi),
+            author (muallif ismi), timestamp (sana va vaqt), details (xabarning aynan matni),
+            priority (Yuqori/O'rtacha/Past).
+            {CLUSTER_NOTE}
+            """
+    
+    def parse_json_response(self, text):
+        """Parse a JSON reply, tolerating markdown code fences around it"""
+        text = text.strip()
+        if text.startswith('```'):
+            text = text.split('\n', 1)[1] if '\n' in text else ''
+            text = text.rsplit('```', 1)[0]
+        return json.loads(text)
+    
+    def analyze_batch(self, batch):
+        """Analyze several small groups with one AI request; returns {group_name: analysis}"""
+        response = self.model.generate_content(self.build_batch_prompt(batch),
+                                               generation_config=self.json_config(BATCH_ANALYSIS_SCHEMA))
+        data = self.parse_json_response(response.text)
+        
+        analyses = {}
+        for entry in data.get('groups', []):
+            if isinstance(entry, dict) and entry.get('group_name'):
+                analyses[entry['group_name']] = entry
+        return analyses
+    
+    def summarize_chunk(self, group_name, conversation):
+        """Map step: condense one part of a large group's conversation"""
+        prompt = f"""
+            Quyidagi Telegram guruhi ({group_name}) suhbatining bir qismidagi barcha muammo va
+            shikoyatlarni qisqa ro'yxat qilib yozing. Har bir qatorda: [Vaqt] Muallif: muammo.
+            Muammo bo'lmagan xabarlarni tashlab keting.
             
+            {conversation}
+            """
+        response = self.model.generate_content(prompt)
+        return response.text.strip()
+    
+    def reduce_summaries(self, group_name, summaries):
+        """Reduce step: analyze the combined chunk summaries of a large group"""
+        response = self.model.generate_content(self.build_analysis_prompt(group_name, summaries),
+                                               generation_config=self.json_config(GROUP_ANALYSIS_SCHEMA))
+        return self.parse_json_response(response.text)
+    
+    def split_for_map_reduce(self, messages):
+        """Split a large group's prompt window into chunks that each fit the token budget"""
+        chunks = []
+        current = []
+        current_tokens = 0
+        chunk_budget = self.token_budget // 2  # Leave room for the map prompt and reply
+        for line in self.format_conversation(messages).split('\n'):
+            tokens = self.estimate_tokens(line)
+            if current and current_tokens + tokens > chunk_budget:
+                chunks.append("\n".join(current))
+                current = []
+                current_tokens = 0
+            current.append(line)
+            current_tokens += tokens
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+    
+    def report_from_analysis(self, group_name, messages, analysis):
+        """Validate a structured group analysis, store its issues and render the report"""
+        issues = self.process_issues_from_ai(analysis, messages)
+        self.issues_by_group[group_name] = issues
+        return self.render_ai_report(group_name, messages, issues, analysis.get('recommendations', []))
+    
+    def escalation_signals(self, group_name, messages):
+        """
+        Cheap local signals computed over the messages since the group's last AI analysis
+        """
+        last = self.last_ai_analysis.get(group_name)
+        since = last['timestamp'] if last else ''
+        new_messages = [msg for msg in messages if msg.get('timestamp', '') > since]
+        
+        complaints = self.detect_complaints(new_messages)
+        urgent = any(self.priority_terms.any(normalized(msg)) for msg in complaints)
+        sentiment = self.analyze_sentiment(join_normalized(new_messages))
+        previous_sentiment = last['sentiment'] if last else 0
+        
+        return {
+            'new_messages': len(new_messages),
+            'complaints': len(complaints),
+            'urgent': urgent,
+            'sentiment': sentiment,
+            'sentiment_delta': abs(sentiment - previous_sentiment),
+        }
+    
+    def should_escalate(self, group_name, messages):
+        """Decide whether a group is worth an AI request; returns (escalate, signals)"""
+        signals = self.escalation_signals(group_name, messages)
+        escalate = (
+            signals['urgent']
+            or signals['complaints'] >= self.min_complaints_for_ai
+            or (signals['new_messages'] > 0 and signals['sentiment_delta'] >= self.min_sentiment_delta_for_ai)
+            or signals['new_messages'] >= self.min_new_messages_for_ai
+        )
+        self.escalation_stats['escalated' if escalate else 'skipped'] += 1
+        return escalate, signals
+    
+    def record_ai_analysis(self, group_name, messages, signals):
+        """Remember where the last AI analysis of a group stopped"""
+        self.last_ai_analysis[group_name] = {
+            'timestamp': max((msg.get('timestamp', '') for msg in messages), default=''),
+            'sentiment': signals['sentiment'],
+        }
+    
+    def analyze_group(self, group_name, messages, force=False):
+        """
+        Gated single-group analysis: quiet groups get the fallback report,
+        groups crossing an escalation threshold (or force=True) go to the AI.
+        """
+        messages = list(messages)
+        escalate, signals = self.should_escalate(group_name, messages)
+        if not (escalate or force) or not self.model:
+            return self.generate_fallback_report(group_name, messages)
+        
+        try:
+            report = self.ai_report(group_name, messages)
         except Exception as e:
+            # Not recorded: the messages stay counted towards the next escalation
             print(f"AI analysis failed: {str(e)}")
             return self.generate_fallback_report(group_name, messages)
+        
+        self.record_ai_analysis(group_name, messages, signals)
+        return report
     
-    def process_issues_from_ai(self, ai_response, messages):
+    def analyze_groups_with_ai(self, groups, force=False, fallback_reports=None):
         """
-        Process AI response to extract and store issues
+        Analyze many groups at once.
+        Quiet groups get the fallback report unless force=True. Escalated small
+        groups are packed several per request, large groups are summarized
+        with map-reduce, and requests run concurrently up to max_concurrent_requests.
+        Fallback reports already computed (see analyze_groups_fallback) can be passed in.
+        Returns {group_name: report_text}.
         """
-        try:
-            # Clear previous issues
-            self.issues = []
+        groups = {name: list(messages) for name, messages in groups.items() if messages}
+        fallback_reports = fallback_reports or {}
+        if not self.api_key:
+            return {name: self.fallback_report(name, messages, fallback_reports) for name, messages in groups.items()}
+        
+        reports = {}
+        escalated = {}
+        signals_by_group = {}
+        for group_name, messages in groups.items():
+            escalate, signals = self.should_escalate(group_name, messages)
+            if escalate or force:
+                escalated[group_name] = messages
+                signals_by_group[group_name] = signals
+            else:
+                reports[group_name] = self.fallback_report(group_name, messages, fallback_reports)
+        
+        batches, large_groups = self.pack_groups(escalated)
+        
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            # Phase 1: packed batches and map steps of large groups all run together
+            batch_futures = [(batch, executor.submit(self.analyze_batch, batch)) for batch in batches]
+            map_futures = []
+            for group_name, messages in large_groups:
+                chunks = self.split_for_map_reduce(messages)
+                map_futures.append((group_name, messages,
+                                    [executor.submit(self.summarize_chunk, group_name, chunk) for chunk in chunks]))
             
-            # Split the response into sections
-            sections = ai_response.split('🔹 MUAMMO #')
+            for batch, future in batch_futures:
+                try:
+                    analyses = future.result()
+                except Exception as e:
+                    print(f"Batched AI analysis failed: {str(e)}")
+                    analyses = {}
+                for group_name, messages, _ in batch:
+                    if group_name in analyses:
+                        reports[group_name] = self.report_from_analysis(group_name, messages, analyses[group_name])
+                        self.record_ai_analysis(group_name, messages, signals_by_group[group_name])
+                    else:
+                        reports[group_name] = self.fallback_report(group_name, messages, fallback_reports)
             
-            for section in sections[1:]:  # Skip the first section (header)
-                issue = {
-                    'id': len(self.issues) + 1,
-                    'type': self.extract_field(section, 'Muammo turi'),
-                    'description': self.extract_field(section, 'Muammo mazmuni'),
-                    'author': self.extract_field(section, 'Muallif'),
-                    'timestamp': self.extract_field(section, 'Vaqt'),
-                    'details': self.extract_field(section, 'Batafsil'),
-                    'priority': self.extract_field(section, 'Muhimlik darajasi'),
-                    'status': 'Yangi',
-                    'source': 'AI Analysis'
-                }
-                
-                # Try to find the original message
-                for msg in messages:
-                    if (issue['author'] in msg.get('sender', '') and 
-                        issue['details'] and issue['details'] in msg.get('text', '')):
-                        issue['message_id'] = msg.get('id')
-                        issue['chat_id'] = msg.get('chat_id')
-                        break
-                
-                self.issues.append(issue)
-                if issue['type']:
-                    self.issue_categories.add(issue['type'])
-                    
-        except Exception as e:
-            print(f"Error processing AI issues: {str(e)}")
+            # Phase 2: reduce each large group's summaries into one analysis
+            reduce_futures = []
+            for group_name, messages, futures in map_futures:
+                try:
+                    summaries = "\n".join(f.result() for f in futures)
+                except Exception as e:
+                    print(f"AI map step failed for {group_name}: {str(e)}")
+                    reports[group_name] = self.fallback_report(group_name, messages, fallback_reports)
+                    continue
+                reduce_futures.append((group_name, messages, executor.submit(self.reduce_summaries, group_name, summaries)))
+            
+            for group_name, messages, future in reduce_futures:
+                try:
+                    reports[group_name] = self.report_from_analysis(group_name, messages, future.result())
+                    self.record_ai_analysis(group_name, messages, signals_by_group[group_name])
+                except Exception as e:
+                    print(f"AI reduce step failed for {group_name}: {str(e)}")
+                    reports[group_name] = self.fallback_report(group_name, messages, fallback_reports)
+        
+        return reports
     
-    def extract_field(self, text, field_name):
-        """Extract field value from formatted text"""
-        try:
-            start = text.find(f"{field_name}:") + len(field_name) + 1
-            end = text.find('\n-', start)
-            if end == -1:
-                end = len(text)
-            return text[start:end].strip()
-        except:
-            return ""
-    
-    def generate_fallback_report(self, group_name, messages):
+    def fallback_report(self, group_name, messages, precomputed):
+        """Precomputed fallback report of a group, or a freshly generated one"""
+        report = precomputed.get(group_name)
+        return report if report is not None else self.generate_fallback_report(group_name, messages)
+    
+    def isolated(self):
+        """
+        Copy sharing the read-only keyword lists but with its own issue state,
+        so concurrent analyses never see each other's issues or categories
+        """
+        worker = copy.copy(self)
+        worker.issues = []
+        worker.issue_categories = set()
+        worker.issues_by_group = {}
+        worker.fallback_pool = None
+        worker.fallback_pool_workers = 0
+        worker.message_store = None
+        worker.complaint_clusters = None
+        return worker
+    
+    def fallback_analysis(self, group_name, messages, activity=None):
+        """
+        Keyword-based analysis of one group on isolated state: the fallback
+        report plus the pieces the monitor's group report is built from.
+        Activity computed for a whole batch (analyze_groups_activity) can be passed in.
+        """
+        worker = self.isolated()
+        issues = worker.detect_issues(messages)
+        all_text = join_normalized(messages)
+        topics = worker.extract_topics(all_text)
+        complaints = worker.detect_complaints(messages)
+        if activity is None:
+            activity = worker.analyze_group_activity(messages)
+        return {
+            'report': worker.generate_fallback_report(group_name, messages, issues),
+            'issues': issues,
+            'issue_categories': worker.issue_categories,
+            'sentiment_score': worker.analyze_sentiment(all_text),
+            'topics': topics,
+            'complaints': complaints,
+            'activity': activity,
+            'recommendations': worker.generate_detailed_recommendations(topics, complaints, activity),
+        }
+    
+    def analyze_groups_fallback(self, groups, workers=None):
+        """
+        Fallback analysis of many groups, fanned out to a process pool in
+        chunks (in-process for a handful of groups or a single worker).
+        Returns {group_name: fallback_analysis result}.
+        """
+        items = [(name, list(messages)) for name, messages in groups.items() if messages]
+        workers = workers or self.fallback_workers or os.cpu_count() or 1
+        if workers <= 1 or len(items) < self.fallback_pool_min_groups:
+            activities = self.analyze_groups_activity(dict(items))
+            results = {name: self.fallback_analysis(name, messages, activities[name]) for name, messages in items}
+        else:
+            # A few chunks per worker: fewer round trips than one task per group, still balanced
+            chunk_size = max(1, len(items) // (workers * 4))
+            chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+            results = {}
+            for part in self.get_fallback_pool(workers).map(fallback_analysis_chunk, chunks):
+                results.update(part)
+        
+        for result in results.values():
+            self.issue_categories |= result['issue_categories']
+        return results
+    
+    def get_fallback_pool(self, workers):
+        """Process pool reused across calls (spawned, so it is safe next to threads)"""
+        if self.fallback_pool is None or self.fallback_pool_workers != workers:
+            if self.fallback_pool is not None:
+                self.fallback_pool.shutdown(wait=False)
+            self.fallback_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            self.fallback_pool_workers = workers
+        return self.fallback_pool
+    
+    def close_fallback_pool(self):
+        if self.fallback_pool is not None:
+            self.fallback_pool.shutdown()
+            self.fallback_pool = None
+            self.fallback_pool_workers = 0
+    
+    def process_issues_from_ai(self, analysis, messages):
+        """
+        Validate the structured AI analysis into Issue records and store them
+        """
+        # Clear previous issues
+        self.issues = []
+        index = MessageIndex(messages)
+        
+        for raw_issue in analysis.get('issues') or []:
+            try:
+                issue = Issue.from_dict(raw_issue, len(self.issues) + 1)
+            except ValueError as e:
+                print(f"Skipping invalid AI issue: {str(e)}")
+                continue
+            
+            # Link back to the original message
+            msg = index.find(issue.author, issue.details)
+            if msg is not None:
+                issue.message_id = msg.get('id')
+                issue.chat_id = msg.get('chat_id', msg.get('group_id'))
+            
+            self.issues.append(issue)
+            self.issue_categories.add(issue.type)
+        
+        return self.issues
+    
+    def render_ai_report(self, group_name, messages, issues, recommendations):
+        """Render the prose report from validated AI issues"""
+        report = "🔍 MUAMMOLAR VA SHIKOYATLAR HISOBOTI\n"
+        report += f"📅 Sana: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
+        report += f"📌 Guruh: {group_name}\n\n"
+        
+        report += "📌 UMUMIY MA'LUMOT:\n"
+        report += f"- Jami xabarlar soni: {len(messages)}\n"
+        report += f"- Faol foydalanuvchilar soni: {len(set(msg.get('sender') for msg in messages))}\n\n"
+        
+        if not issues:
+            report += "✅ Hech qanday muammo topilmadi.\n"
+        else:
+            report += "🚨 ANIQLANGAN MUAMMOLAR:\n\n"
+            for issue in issues:
+                report += (f"🔹 MUAMMO #{issue.id}:\n"
+                           f"- Muammo mazmuni: {issue.description}\n"
+                           f"- Muammo turi: {issue.type}\n"
+                           f"- Muallif: {issue.author}\n"
+                           f"- Vaqt: {issue.timestamp}\n"
+                           f"- Batafsil: {issue.details}\n"
+                           f"- Muhimlik darajasi: {issue.priority}\n"
+                           f"- Holati: {issue.status}\n\n")
+            
+            report += "📊 STATISTIKA:\n"
+            report += f"- Jami muammolar soni: {len(issues)}\n"
+            report += "- Muammolar bo'yicha taqsimot:\n"
+            by_type = defaultdict(int)
+            for issue in issues:
+                by_type[issue.type] += 1
+            for issue_type in ISSUE_TYPES:
+                if by_type[issue_type]:
+                    report += f"  * {issue_type}: {by_type[issue_type]} ta\n"
+            
+            report += "\n🔝 ENG MUHIM 5 TA MUAMMO:\n"
+            top_issues = sorted(issues, key=lambda x: PRIORITY_RANK.get(x.priority, 0), reverse=True)[:5]
+            for i, issue in enumerate(top_issues, 1):
+                report += f"{i}. {issue.description} - {issue.author} - {issue.timestamp}\n"
+        
+        if recommendations:
+            report += "\n📋 TAVSIYALAR:\n"
+            for recommendation in recommendations:
+                report += f"- {recommendation}\n"
+        
+        return report
+    
+    def generate_fallback_report(self, group_name, messages, issues=None):
         """Generate a fallback report when AI is not available"""
         # This is a simplified version of the report
-        issues = self.detect_issues(messages)
+        if issues is None:
+            issues = self.detect_issues(messages)
         
         report = f"🔍 MUAMMOLAR HISOBOTI (FALLBACK)\n"
         report += f"📅 Sana: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}\n"
@@ -237,25 +822,24 @@ class GroupAnalyzer:
         issues = []
         
         for msg in messages:
-            text = msg.get('text', '').lower()
+            text = normalized(msg)
             if not text:
                 continue
                 
             # Check for complaint keywords
-            complaint_terms = [term for term in self.complaint_keywords if term in text]
+            complaint_terms = self.complaint_keywords.found(text)
             
             if complaint_terms:
                 # Determine category based on keywords
                 category = 'Boshqa'
                 for cat, keywords in self.topic_keywords.items():
-                    if any(keyword in text for keyword in keywords):
+                    if keywords.any(text):
                         category = cat
                         break
                 
                 # Determine priority
-                priority_terms = ['zudlik', 'zarur', 'hal qilish', 'tezda', 'shoshilinch', 'xavfli']
                 priority = 2  # Medium by default
-                if any(term in text for term in priority_terms):
+                if self.priority_terms.any(text):
                     priority = 3  # High
                 elif 'iltimos' in text or 'iltoimos' in text:
                     priority = 1  # Low
@@ -287,9 +871,9 @@ class GroupAnalyzer:
         Analyze sentiment of text (fallback method)
         Returns a score between -1 (very negative) and 1 (very positive)
         """
-        text_lower = text.lower()
-        positive_count = sum(1 for word in self.positive_words if word in text_lower)
-        negative_count = sum(1 for word in self.negative_words if word in text_lower)
+        text = normalized(text)
+        positive_count = self.positive_words.count(text)
+        negative_count = self.negative_words.count(text)
         
         total_sentiment_words = positive_count + negative_count
         if total_sentiment_words > 0:
@@ -301,30 +885,66 @@ class GroupAnalyzer:
         """
         Detect complaints in messages (fallback method)
         """
-        complaints = []
-        for msg in messages:
-            text_lower = msg['text'].lower()
-            if any(keyword in text_lower for keyword in self.complaint_keywords):
-                complaints.append(msg)
-        return complaints
+        return [msg for msg in messages if self.complaint_keywords.any(normalized(msg))]
+    
+    def classify_message(self, message):
+        """
+        Per-message features used for incremental rollups and live rankings:
+        complaint flag and priority, sentiment score, topics mentioned and aggression flag.
+        Accepts the message text or the message itself (its normalized text is cached on it).
+        """
+        text = normalized(message)
+        complaint = self.complaint_keywords.any(text)
+        return {
+            'complaint': complaint,
+            'priority': self.complaint_priority(text) if complaint else 0,
+            'sentiment': self.analyze_sentiment(text),
+            'topics': [topic for topic, keywords in self.topic_keywords.items() if keywords.any(text)],
+            'aggressive': self.aggressive_keywords.any(text),
+        }
+    
+    def complaint_priority(self, text):
+        """Urgency of a complaint: 3 critical, 2 important, 1 normal"""
+        text = normalized(text)
+        if self.critical_terms.any(text):
+            return 3
+        if self.important_terms.any(text):
+            return 2
+        return 1
     
     def extract_topics(self, text):
         """
         Extract topics from text (fallback method)
         """
         topics = {}
-        text_lower = text.lower()
+        text = normalized(text)
         
         for topic, keywords in self.topic_keywords.items():
-            count = sum(1 for keyword in keywords if keyword in text_lower)
-            topics[topic] = count
+            topics[topic] = keywords.count(text)
             
         return topics
     
+    def analyze_groups_activity(self, groups):
+        """
+        Activity of many groups ({group_name: messages}) at once: vectorized over
+        a columnar batch when NumPy is installed, per message otherwise
+        """
+        # Imported here: NumPy adds ~50 ms to every process that imports the analyzer
+        from activity_columns import ActivityColumns, np
+        if np is None:
+            return {name: self.analyze_group_activity(messages) for name, messages in groups.items()}
+        return ActivityColumns.from_groups(groups).activity()
+    
     def analyze_group_activity(self, messages):
         """
-        Analyze group activity patterns with more details
+        Analyze group activity patterns with more details.
+        Also accepts a single-group ActivityColumns batch.
         """
+        # A batch can only come from an already imported activity_columns (don't import NumPy to check)
+        columns = sys.modules.get('activity_columns')
+        if columns is not None and isinstance(messages, columns.ActivityColumns):
+            return next(iter(messages.activity().values()))
+        
         # Activity by hour of day
         hourly_activity = defaultdict(int)
         
@@ -335,9 +955,9 @@ class GroupAnalyzer:
         message_lengths = []
         
         for msg in messages:
-            # Parse timestamp (assuming ISO format)
+            # Epoch seconds on MessageRecords, ISO timestamps on message dicts
             try:
-                timestamp = datetime.datetime.fromisoformat(msg['timestamp'])
+                timestamp = message_time(msg)
                 hourly_activity[timestamp.hour] += 1
                 participants[msg['sender']] += 1
                 message_lengths.append(len(msg['text']))
@@ -410,5 +1030,23 @@ class GroupAnalyzer:
             
         return recommendations
 
-# Export the analyzer
-analyzer = GroupAnalyzer()
\ No newline at end of file
+def fallback_analysis_chunk(chunk):
+    """Process pool task: fallback analysis of a chunk of (group_name, messages)"""
+    analyzer = get_analyzer()
+    activities = analyzer.analyze_groups_activity(dict(chunk))
+    return {name: analyzer.fallback_analysis(name, messages, activities[name]) for name, messages in chunk}
+
+_analyzer = None
+
+def get_analyzer():
+    """The shared analyzer, created on first use"""
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = GroupAnalyzer()
+    return _analyzer
+
+def __getattr__(name):
+    # Export the analyzer: `from group_analyzer import analyzer` creates it on first import
+    if name == 'analyzer':
+        return get_analyzer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import time
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class GroupTable:
+    """
+    Memory-bounded replacement for a defaultdict keyed by group name.
+    Groups idle for longer than `idle_seconds` are spilled to compressed files
+    in `spill_dir`, and least recently used groups are spilled whenever the
+    estimated size exceeds `max_bytes`. A spilled group is loaded back
+    transparently the next time it is accessed. Spill files are replaced
+    atomically and kept after a reload, so a reader holding a copy of
+    spilled_files() (e.g. a report thread) always finds a complete file.
+    """
+    
+    def __init__(self, name, factory, size_of, idle_seconds=6 * 3600, max_bytes=256 * 1024 * 1024,
+                 spill_dir='group_spill'):
+        self.name = name
+        self.factory = factory
+        self.size_of = size_of  # Cheap estimate of a value's memory in bytes
+        self.idle_seconds = idle_seconds
+        self.max_bytes = max_bytes
+        self.spill_dir = os.path.join(spill_dir, name)
+        
+        self.hot = OrderedDict()  # key -> value, least recently used first
+        self.last_access = {}
+        self.sizes = {}
+        self.total_bytes = 0
+        self.spilled = {}  # key -> spill file path
+        self.stats = {'evictions': 0, 'idle_evictions': 0, 'reloads': 0, 'spill_errors': 0}
+        self.spill_dir_ready = False  # Created on the first spill, not on import
+    
+    def clear_spill(self):
+        """
+        Remove files spilled by a previous run (their groups are not in this
+        table). Called at startup rather than on construction, so importing the
+        module (e.g. in a worker process) never touches a running monitor's files.
+        """
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self.spill_dir_ready = False
+        self.spilled.clear()
+    
+    def __getitem__(self, key):
+        value = self.hot.get(key)
+        if value is None:
+            value = self.load(key) if key in self.spilled else self.factory()
+            self.hot[key] = value
+        else:
+            self.hot.move_to_end(key)
+        self.last_access[key] = time.monotonic()
+        self.update_size(key, value)
+        if self.total_bytes > self.max_bytes:
+            self.evict_to_limit(keep=key)
+        return value
+    
+    def __contains__(self, key):
+        return key in self.hot or key in self.spilled
+    
+    def __len__(self):
+        return len(self.hot) + len(self.spilled)
+    
+    def keys(self):
+        return list(self.hot) + list(self.spilled)
+    
+    def items(self):
+        """
+        All groups, spilled ones included. Spilled groups are read from disk
+        without being made hot, so a report does not blow the memory ceiling.
+        """
+        yield from self.hot_items()
+        yield from self.read_spilled(self.spilled_files())
+    
+    def hot_items(self):
+        """(key, value) of the groups in memory"""
+        return list(self.hot.items())
+    
+    def spilled_files(self):
+        """{key: spill file} of the groups on disk, to be read with read_spilled() from any thread"""
+        return dict(self.spilled)
+    
+    def read_spilled(self, files):
+        """(key, value) of spilled groups read from their files, skipping unreadable ones"""
+        for key, path in files.items():
+            value = self.read_file(key, path)
+            if value is not None:
+                yield key, value
+    
+    def update_size(self, key, value):
+        size = self.size_of(value)
+        self.total_bytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+    
+    def evict(self, key):
+        """Write a group to disk and drop it from memory"""
+        value = self.hot.get(key)
+        if value is None:
+            return False
+        path = os.path.join(self.spill_dir, hashlib.sha1(str(key).encode('utf-8')).hexdigest() + '.pkl.z')
+        try:
+            if not self.spill_dir_ready:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self.spill_dir_ready = True
+            with open(path + '.tmp', 'wb') as f:
+                f.write(zlib.compress(pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL)))
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            self.stats['spill_errors'] += 1
+            logger.warning(f"Could not spill group '{key}' to disk: {str(e)}")
+            return False
+        del self.hot[key]
+        self.last_access.pop(key, None)
+        self.total_bytes -= self.sizes.pop(key, 0)
+        self.spilled[key] = path
+        self.stats['evictions'] += 1
+        return True
+    
+    def evict_to_limit(self, keep=None):
+        """Spill least recently used groups until the estimate is under max_bytes"""
+        for key in list(self.hot):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key != keep:
+                self.evict(key)
+    
+    def evict_idle(self):
+        """Spill every group not accessed for idle_seconds; returns how many were spilled"""
+        cutoff = time.monotonic() - self.idle_seconds
+        evicted = 0
+        for key in list(self.hot):
+            if self.last_access.get(key, 0) >= cutoff:
+                break  # Ordered by access, so the rest are more recent
+            if self.evict(key):
+                evicted += 1
+        self.stats['idle_evictions'] += evicted
+        return evicted
+    
+    def read_file(self, key, path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.loads(zlib.decompress(f.read()))[1]
+        except Exception as e:
+            logger.warning(f"Could not read spilled group '{key}': {str(e)}")
+            return None
+    
+    def load(self, key):
+        """Bring a spilled group back into memory (its file stays until it is spilled again)"""
+        value = self.read_file(key, self.spilled.pop(key))
+        self.stats['reloads'] += 1
+        return value if value is not None else self.factory()
+    
+    def metrics(self):
+        return dict(self.stats, hot=len(self.hot), spilled=len(self.spilled), bytes=self.total_bytes)
@@ -0,0 +1,119 @@
+import sys
+from datetime import datetime
+from text_normalizer import normalize
+
+class GroupRef:
+    """Per-group fields shared by every message of that group"""
+    
+    __slots__ = ('name', 'id', 'link')
+    
+    def __init__(self, name, group_id=None, link=None):
+        self.name = sys.intern(name) if name else ''
+        self.id = group_id
+        self.link = link
+
+# One GroupRef per group, so messages hold a pointer instead of copies of the name and link
+group_refs = {}
+
+def group_ref(name, group_id=None, link=None):
+    """Shared GroupRef for a group (created on first use, link kept current)"""
+    key = group_id if group_id is not None else name
+    ref = group_refs.get(key)
+    if ref is None:
+        ref = group_refs[key] = GroupRef(name, group_id, link)
+    else:
+        if name and ref.name != name:
+            ref.name = sys.intern(name)  # Group was renamed
+        if link is not None:
+            ref.link = link
+    return ref
+
+def stored_group_ref(name, group_id=None):
+    """
+    GroupRef for a message read back from the store: the live one if the group is known,
+    otherwise a detached copy. Never renames or registers refs, so it is safe off the event loop.
+    """
+    ref = group_refs.get(group_id if group_id is not None else name)
+    return ref if ref is not None else GroupRef(name, group_id)
+
+class MessageRecord:
+    """
+    Compact stored message: slotted, group fields shared through a GroupRef,
+    sender names interned and the timestamp kept as integer epoch seconds.
+    Supports read-only dict-style access (msg['text'], msg.get('timestamp'))
+    so code written for message dicts works on it unchanged. The normalized
+    text used for keyword matching is computed once and cached on the record.
+    """
+    
+    __slots__ = ('text', 'sender', 'sender_id', 'group', 'epoch', 'id',
+                 'is_forwarded', 'reply_to_msg_id', 'dup_key', 'dup_groups', 'cluster_id', 'norm')
+    
+    FIELDS = ('text', 'sender', 'sender_id', 'group_name', 'group_id', 'group_link', 'timestamp',
+              'id', 'is_forwarded', 'reply_to_msg_id', 'dup_key', 'dup_groups', 'cluster_id')
+    
+    def __init__(self, text, sender, sender_id, group, epoch, id=None,
+                 is_forwarded=False, reply_to_msg_id=None, dup_key=None, dup_groups=None, cluster_id=None):
+        self.text = text or ''
+        self.sender = sys.intern(sender) if sender else sender
+        self.sender_id = sender_id
+        self.group = group
+        self.epoch = int(epoch)
+        self.id = id
+        self.is_forwarded = is_forwarded
+        self.reply_to_msg_id = reply_to_msg_id
+        self.dup_key = dup_key
+        self.dup_groups = dup_groups
+        self.cluster_id = cluster_id  # Complaint cluster (complaint_clusters.ComplaintClusters)
+        self.norm = None
+    
+    @property
+    def group_name(self):
+        return self.group.name
+    
+    @property
+    def group_id(self):
+        return self.group.id
+    
+    @property
+    def group_link(self):
+        return self.group.link
+    
+    @property
+    def normalized(self):
+        """Normalized text (text_normalizer.normalize), computed on first use"""
+        if self.norm is None:
+            self.norm = normalize(self.text)
+        return self.norm
+    
+    @property
+    def timestamp(self):
+        """ISO timestamp, as in the message dicts"""
+        return datetime.fromtimestamp(self.epoch).isoformat()
+    
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def get(self, key, default=None):
+        """Like dict.get; unset (None) fields count as missing"""
+        value = getattr(self, key, None) if key in self.FIELDS or key == 'epoch' else None
+        return default if value is None else value
+    
+    def __contains__(self, key):
+        return self.get(key) is not None
+    
+    def __reduce__(self):
+        # Re-attach to the shared GroupRef (and re-intern the sender) when unpickled
+        return (restore_record, (self.text, self.sender, self.sender_id, self.group.name, self.group.id, self.epoch,
+                                 self.id, self.is_forwarded, self.reply_to_msg_id, self.dup_key, self.dup_groups,
+                                 self.cluster_id))
+    
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.FIELDS}
+    
+    def __repr__(self):
+        return f"MessageRecord({self.group_name!r}, {self.id!r}, {self.sender!r}, {self.text[:30]!r})"
+
+def restore_record(text, sender, sender_id, group_name, group_id, epoch, *rest):
+    return MessageRecord(text, sender, sender_id, group_ref(group_name, group_id), epoch, *rest)
@@ -0,0 +1,307 @@
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime
+from message_records import MessageRecord, stored_group_ref
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    group_id INTEGER,
+    message_id INTEGER,
+    group_name TEXT NOT NULL,
+    sender TEXT,
+    sender_id INTEGER,
+    text TEXT NOT NULL DEFAULT '',
+    timestamp REAL NOT NULL,
+    is_forwarded INTEGER NOT NULL DEFAULT 0,
+    reply_to_msg_id INTEGER,
+    cluster_id INTEGER,
+    UNIQUE (group_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_group_id_time ON messages (group_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_group_name_time ON messages (group_name, timestamp);
+CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (timestamp);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    text, content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+END;
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    group_id INTEGER,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    sender_count INTEGER NOT NULL DEFAULT 0,
+    complaint_count INTEGER NOT NULL DEFAULT 0,
+    sentiment_sum REAL NOT NULL DEFAULT 0,
+    aggression_hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, group_name)
+);
+CREATE TABLE IF NOT EXISTS daily_topic_counts (
+    day TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, group_name, topic)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS daily_senders (
+    day TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    sender_key TEXT NOT NULL,
+    PRIMARY KEY (day, group_name, sender_key)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_UPSERT = """
+INSERT INTO daily_rollups (day, group_name, group_id, message_count, complaint_count, sentiment_sum, aggression_hits)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, group_name) DO UPDATE SET
+    group_id = excluded.group_id,
+    message_count = message_count + excluded.message_count,
+    complaint_count = complaint_count + excluded.complaint_count,
+    sentiment_sum = sentiment_sum + excluded.sentiment_sum,
+    aggression_hits = aggression_hits + excluded.aggression_hits
+"""
+
+TOPIC_UPSERT = """
+INSERT INTO daily_topic_counts (day, group_name, topic, count) VALUES (?, ?, ?, ?)
+ON CONFLICT (day, group_name, topic) DO UPDATE SET count = count + excluded.count
+"""
+
+def to_epoch(value):
+    """Accept datetimes, ISO strings or epoch numbers"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+class MessageStore:
+    """
+    Persistent message history (SQLite in WAL mode with an FTS5 index) plus
+    daily per-group rollups that are updated in the same transaction as the
+    inserts. Writes are buffered and inserted in batches by flush(), which the
+    monitor runs on a worker thread; reads use per-thread connections so report
+    workers can query while messages are written.
+    """
+    
+    def __init__(self, path='messages.db', batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self.pending_lock = threading.Lock()  # Guards the buffer only, so add() never waits for a flush
+        
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # Databases created before complaint clustering lack the cluster column
+        if 'cluster_id' not in {row['name'] for row in conn.execute("PRAGMA table_info(messages)")}:
+            conn.execute("ALTER TABLE messages ADD COLUMN cluster_id INTEGER")
+        conn.commit()
+    
+    def connection(self):
+        """Connection for the calling thread"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self.local.conn = conn
+        return conn
+    
+    def add(self, message, features=None):
+        """
+        Buffer a message (MessageRecord or message dict); returns True when the batch
+        is full and should be flushed. `features` (GroupAnalyzer.classify_message) feed
+        the daily rollups. The row is built at flush time, so fields filled in after
+        ingestion (e.g. a sender name resolved in the background) are stored.
+        """
+        with self.pending_lock:
+            self.pending.append((features, message))
+            return len(self.pending) >= self.batch_size
+    
+    def message_row(self, message):
+        return (
+            message.get('group_id'),
+            message.get('id'),
+            message.get('group_name', ''),
+            message.get('sender'),
+            message.get('sender_id'),
+            message.get('text') or '',
+            message.get('epoch') or to_epoch(message.get('timestamp')) or datetime.now().timestamp(),
+            1 if message.get('is_forwarded') else 0,
+            message.get('reply_to_msg_id'),
+            message.get('cluster_id'),
+        )
+    
+    def flush(self):
+        """
+        Insert all buffered messages in one transaction; returns how many were written.
+        If the transaction fails the batch goes back in front of the buffer and the error is raised.
+        """
+        with self.write_lock:
+            with self.pending_lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            conn = self.connection()
+            rollups = {}
+            topics = defaultdict(int)
+            senders = set()
+            try:
+                with conn:
+                    for features, message in batch:
+                        row = self.message_row(message)
+                        cursor = conn.execute(
+                            "INSERT OR IGNORE INTO messages (group_id, message_id, group_name, sender, sender_id, "
+                            "text, timestamp, is_forwarded, reply_to_msg_id, cluster_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            row,
+                        )
+                        # Only messages stored for the first time count towards the rollups
+                        if cursor.rowcount:
+                            self.accumulate_rollup(rollups, topics, senders, row, features)
+                    self.write_rollups(conn, rollups, topics, senders)
+            except Exception:
+                # Rolled back: keep the messages (in order) for the next flush
+                with self.pending_lock:
+                    self.pending[:0] = batch
+                raise
+            return len(batch)
+    
+    def accumulate_rollup(self, rollups, topics, senders, row, features):
+        """Add one message to the in-batch rollup deltas"""
+        group_id, _, group_name, sender, sender_id, _, timestamp = row[:7]
+        day = datetime.fromtimestamp(timestamp).date().isoformat()
+        key = (day, group_name)
+        delta = rollups.get(key)
+        if delta is None:
+            delta = rollups[key] = [group_id, 0, 0, 0.0, 0]
+        delta[1] += 1
+        if features:
+            delta[2] += 1 if features.get('complaint') else 0
+            delta[3] += features.get('sentiment', 0)
+            delta[4] += 1 if features.get('aggressive') else 0
+            for topic in features.get('topics', ()):
+                topics[(day, group_name, topic)] += 1
+        sender_key = str(sender_id) if sender_id is not None else f"name:{sender}"
+        senders.add((day, group_name, sender_key))
+    
+    def write_rollups(self, conn, rollups, topics, senders):
+        """Apply the batch deltas to the daily rollup tables"""
+        conn.executemany(ROLLUP_UPSERT, [(day, group_name, *delta) for (day, group_name), delta in rollups.items()])
+        conn.executemany(TOPIC_UPSERT, [(*key, count) for key, count in topics.items()])
+        conn.executemany("INSERT OR IGNORE INTO daily_senders (day, group_name, sender_key) VALUES (?, ?, ?)", senders)
+        conn.executemany(
+            "UPDATE daily_rollups SET sender_count = (SELECT COUNT(*) FROM daily_senders s "
+            "WHERE s.day = daily_rollups.day AND s.group_name = daily_rollups.group_name) "
+            "WHERE day = ? AND group_name = ?",
+            list(rollups),
+        )
+    
+    def period_rollup(self, since_day, until_day=None):
+        """
+        Per-group totals over a range of days (inclusive, ISO dates) from the rollup tables.
+        Returns {group_name: {...}}; cost depends on days x groups, not on message volume.
+        """
+        until_day = until_day or datetime.now().date().isoformat()
+        conn = self.connection()
+        groups = {}
+        for row in conn.execute(
+            "SELECT group_name, SUM(message_count) AS messages, SUM(complaint_count) AS complaints, "
+            "SUM(sentiment_sum) AS sentiment_sum, SUM(aggression_hits) AS aggression_hits, "
+            "COUNT(DISTINCT day) AS active_days "
+            "FROM daily_rollups WHERE day BETWEEN ? AND ? GROUP BY group_name",
+            (since_day, until_day),
+        ):
+            groups[row['group_name']] = {
+                'messages': row['messages'],
+                'complaints': row['complaints'],
+                'avg_sentiment': row['sentiment_sum'] / row['messages'] if row['messages'] else 0.0,
+                'aggression_hits': row['aggression_hits'],
+                'active_days': row['active_days'],
+                'senders': 0,
+                'topics': {},
+            }
+        for row in conn.execute(
+            "SELECT group_name, COUNT(DISTINCT sender_key) AS senders FROM daily_senders "
+            "WHERE day BETWEEN ? AND ? GROUP BY group_name",
+            (since_day, until_day),
+        ):
+            if row['group_name'] in groups:
+                groups[row['group_name']]['senders'] = row['senders']
+        for row in conn.execute(
+            "SELECT group_name, topic, SUM(count) AS count FROM daily_topic_counts "
+            "WHERE day BETWEEN ? AND ? GROUP BY group_name, topic",
+            (since_day, until_day),
+        ):
+            if row['group_name'] in groups:
+                groups[row['group_name']]['topics'][row['topic']] = row['count']
+        return groups
+    
+    def period_distinct_senders(self, since_day, until_day=None):
+        """Distinct senders across all groups over a range of days"""
+        until_day = until_day or datetime.now().date().isoformat()
+        return self.connection().execute(
+            "SELECT COUNT(DISTINCT sender_key) FROM daily_senders WHERE day BETWEEN ? AND ?",
+            (since_day, until_day),
+        ).fetchone()[0]
+    
+    def query(self, group_name=None, group_id=None, since=None, until=None, keyword=None, limit=1000):
+        """
+        Messages matching all given filters, oldest first, as MessageRecords.
+        `keyword` is a full-text (FTS5) search; since/until accept datetimes,
+        ISO strings or epoch seconds.
+        """
+        conditions = []
+        params = []
+        if group_name is not None:
+            conditions.append("m.group_name = ?")
+            params.append(group_name)
+        if group_id is not None:
+            conditions.append("m.group_id = ?")
+            params.append(group_id)
+        if since is not None:
+            conditions.append("m.timestamp >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            conditions.append("m.timestamp < ?")
+            params.append(to_epoch(until))
+        
+        sql = "SELECT m.* FROM messages m"
+        if keyword:
+            sql += " JOIN messages_fts f ON f.rowid = m.rowid"
+            conditions.append("messages_fts MATCH ?")
+            params.append('"' + keyword.replace('"', '""') + '"')
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        # Newest `limit` rows, returned oldest first like the in-memory deques
+        sql = f"SELECT * FROM ({sql} ORDER BY m.timestamp DESC LIMIT ?) ORDER BY timestamp"
+        params.append(limit)
+        
+        return [self.row_to_message(row) for row in self.connection().execute(sql, params)]
+    
+    def row_to_message(self, row):
+        return MessageRecord(
+            text=row['text'],
+            sender=row['sender'],
+            sender_id=row['sender_id'],
+            group=stored_group_ref(row['group_name'], row['group_id']),
+            epoch=row['timestamp'],
+            id=row['message_id'],
+            is_forwarded=bool(row['is_forwarded']),
+            reply_to_msg_id=row['reply_to_msg_id'],
+            cluster_id=row['cluster_id'],
+        )
+    
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM messages").fetchone()[0]
@@ -0,0 +1,142 @@
+import operator
+import random
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from text_normalizer import normalized
+
+# Mersenne prime for the universal hash family used by MinHash
+MERSENNE_PRIME = (1 << 61) - 1
+
+class MinHash:
+    """MinHash signatures of hashed shingle sets, split into LSH bands"""
+    
+    def __init__(self, num_hashes=32, bands=8):
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.rows = num_hashes // bands
+        # Fixed seed so signatures are stable across restarts and processes
+        rng = random.Random(42)
+        self.hash_params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+                            for _ in range(num_hashes)]
+    
+    def signature(self, shingles):
+        """MinHash signature of a shingle set"""
+        return tuple(
+            min((a * x + b) % MERSENNE_PRIME for x in shingles)
+            for a, b in self.hash_params
+        )
+    
+    def band_keys(self, signature, salt=None):
+        """Bucket key of each band; a salt (e.g. a category) keeps unrelated buckets apart"""
+        rows = self.rows
+        return [hash((salt, signature[i * rows:(i + 1) * rows])) for i in range(self.bands)]
+    
+    def similarity(self, sig_a, sig_b):
+        """Estimated Jaccard similarity of two signatures"""
+        return sum(map(operator.eq, sig_a, sig_b)) / self.num_hashes
+
+def add_recent(bucket, key, limit):
+    """Add (or refresh) a key in an LSH bucket, a dict used as an ordered set; only the newest `limit` are kept"""
+    bucket.pop(key, None)
+    bucket[key] = None
+    if len(bucket) > limit:
+        del bucket[next(iter(bucket))]
+
+class NearDuplicateIndex:
+    """
+    MinHash + LSH index that tags near-duplicate messages across all groups.
+    Each new message is matched against earlier ones in O(bands) bucket lookups;
+    every message maps to a canonical key shared by all of its near-duplicates.
+    Buckets keep only their most recently added or matched keys, so messages
+    sharing common phrasing do not make every lookup scan thousands of entries.
+    """
+    
+    def __init__(self, num_hashes=32, bands=8, threshold=0.7, min_tokens=4, max_entries=50000, max_candidates=8,
+                 max_bucket=64):
+        self.minhash = MinHash(num_hashes, bands)
+        self.bands = bands
+        self.threshold = threshold
+        self.min_tokens = min_tokens  # Short texts ("rahmat", "ok") are not deduplicated
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.max_bucket = max_bucket
+        
+        self.buckets = [defaultdict(dict) for _ in range(bands)]  # band key -> {canonical key: None}, oldest first
+        self.entries = OrderedDict()  # canonical key -> {'signature', 'groups', 'count'}
+        self.stats = {'messages': 0, 'duplicates': 0}
+    
+    def shingles(self, text):
+        """Word bigrams of a text (normalized, so script variants match), hashed to 32-bit ints"""
+        tokens = normalized(text).split()
+        if len(tokens) < self.min_tokens:
+            return None
+        return {zlib.crc32(f"{a} {b}".encode('utf-8')) for a, b in zip(tokens, tokens[1:])}
+    
+    def signature(self, text):
+        """MinHash signature of a text, None if it is too short; uses no index state, so it can run in another process"""
+        shingles = self.shingles(text)
+        return self.minhash.signature(shingles) if shingles else None
+    
+    def add(self, key, text, group_name, signature=None):
+        """
+        Register a message and return its canonical key: the key of the first
+        near-duplicate seen, or its own key if it is new. `signature` is the
+        text's signature() when it was already computed (by a shard worker).
+        """
+        self.stats['messages'] += 1
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None:
+            return key
+        
+        band_keys = self.minhash.band_keys(signature)
+        
+        # Candidates share at least one band; verify the ones sharing the most
+        # bands with the full signature so crowded buckets stay cheap
+        band_hits = Counter()
+        for band, band_key in enumerate(band_keys):
+            band_hits.update(self.buckets[band].get(band_key, {}).keys())
+        
+        best_key, best_similarity = None, 0.0
+        for candidate, _ in band_hits.most_common(self.max_candidates):
+            similarity = self.minhash.similarity(signature, self.entries[candidate]['signature'])
+            if similarity > best_similarity:
+                best_key, best_similarity = candidate, similarity
+        
+        if best_key is not None and best_similarity >= self.threshold:
+            entry = self.entries[best_key]
+            entry['count'] += 1
+            if group_name not in entry['groups']:
+                entry['groups'].append(group_name)
+            self.entries.move_to_end(best_key)
+            for band, band_key in enumerate(entry['band_keys']):
+                add_recent(self.buckets[band][band_key], best_key, self.max_bucket)
+            self.stats['duplicates'] += 1
+            return best_key
+        
+        self.entries[key] = {'signature': signature, 'band_keys': band_keys, 'groups': [group_name], 'count': 1}
+        for band, band_key in enumerate(band_keys):
+            add_recent(self.buckets[band][band_key], key, self.max_bucket)
+        if len(self.entries) > self.max_entries:
+            self.evict_oldest()
+        return key
+    
+    def evict_oldest(self):
+        """Drop the least recently matched entry to keep memory bounded"""
+        key, entry = self.entries.popitem(last=False)
+        for band, band_key in enumerate(entry['band_keys']):
+            bucket = self.buckets[band].get(band_key)
+            if bucket:
+                bucket.pop(key, None)
+                if not bucket:
+                    del self.buckets[band][band_key]
+    
+    def groups(self, canonical_key):
+        """Groups the underlying message appeared in (a shared, live list)"""
+        entry = self.entries.get(canonical_key)
+        return entry['groups'] if entry else []
+    
+    def count(self, canonical_key):
+        """How many times the underlying message was seen"""
+        entry = self.entries.get(canonical_key)
+        return entry['count'] if entry else 1
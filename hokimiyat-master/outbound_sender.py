@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from telethon.errors import FloodWaitError
+
+logger = logging.getLogger(__name__)
+
+# Telegram counts message length in UTF-16 code units
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Characters that glue an emoji sequence together; never cut next to them
+ZERO_WIDTH_JOINER = '\u200d'
+JOINERS = {ZERO_WIDTH_JOINER, '\ufe0f', '\ufe0e'}
+
+def utf16_len(text):
+    """Length of a text as Telegram counts it"""
+    return len(text.encode('utf-16-le')) // 2
+
+def hard_split(text, limit):
+    """Split a single over-long line by length without breaking emoji sequences"""
+    chunks = []
+    current = []
+    current_len = 0
+    for char in text:
+        char_len = 2 if ord(char) > 0xFFFF else 1
+        if current and current_len + char_len > limit:
+            # Move a trailing emoji sequence (e.g. "👨‍👩") to the next chunk as a whole
+            carry = []
+            while current and ((carry[0] if carry else char) in JOINERS or current[-1] == ZERO_WIDTH_JOINER):
+                carry.insert(0, current.pop())
+            if not current:
+                current, carry = carry, []  # One giant sequence: cut it anyway
+            chunks.append("".join(current))
+            current = carry
+            current_len = utf16_len("".join(carry))
+        current.append(char)
+        current_len += char_len
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Split a long message into chunks within Telegram's limit.
+    Prefers section boundaries (blank lines), then line boundaries, and only
+    cuts inside a line when the line alone is too long.
+    """
+    if utf16_len(text) <= limit:
+        return [text]
+    
+    # Break into pieces that each fit: whole sections, or lines of oversized sections
+    pieces = []
+    for section in text.split('\n\n'):
+        if utf16_len(section) <= limit:
+            pieces.append((section, '\n\n'))
+            continue
+        for line in section.split('\n'):
+            if utf16_len(line) <= limit:
+                pieces.append((line, '\n'))
+            else:
+                pieces.extend((part, '') for part in hard_split(line, limit))
+        # The section's last piece is followed by a section break
+        pieces[-1] = (pieces[-1][0], '\n\n')
+    
+    # Greedily pack pieces into chunks
+    chunks = []
+    current = ''
+    for piece, separator in pieces:
+        candidate = current + piece if current else piece
+        if current and utf16_len(candidate) > limit:
+            chunks.append(current.rstrip('\n'))
+            candidate = piece
+        current = candidate + separator
+    if current.strip():
+        chunks.append(current.rstrip('\n'))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def consume_exception(future):
+    """Mark a chunk's failure as seen: the worker has already logged it"""
+    if not future.cancelled():
+        future.exception()
+
+class OutboundSender:
+    """
+    Outbound message queue for the Telegram client.
+    Splits long texts, paces sends per chat and globally, sleeps exactly as long
+    as Telegram asks on FloodWait, and retries connection errors.
+    A single worker keeps chunks of one message in order.
+    Timed-out sends are not retried since Telegram may have delivered them; a
+    connection dropped after Telegram accepted a chunk can still duplicate it.
+    """
+    
+    def __init__(self, client, per_chat_interval=3.0, global_interval=0.05, max_retries=3, on_failure=None):
+        self.client = client
+        self.per_chat_interval = per_chat_interval  # ~20 messages per minute per group
+        self.global_interval = global_interval  # ~20 messages per second overall
+        self.max_retries = max_retries
+        self.on_failure = on_failure  # Called with (text, error) when a chunk is given up on
+        self.queue = asyncio.Queue()
+        self.worker = None
+        self.last_sent_per_chat = {}
+        self.last_sent = 0.0
+        self.latencies = deque(maxlen=100)
+        self.stats = {'sent': 0, 'failed': 0, 'flood_waits': 0, 'flood_wait_seconds': 0, 'retries': 0}
+    
+    def enqueue(self, entity, text):
+        """
+        Queue a message (split into chunks); returns a future per chunk.
+        Failures are logged by the worker, so callers may ignore the futures.
+        """
+        self.ensure_worker()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for chunk in split_message(text):
+            future = loop.create_future()
+            future.add_done_callback(consume_exception)
+            self.queue.put_nowait((entity, chunk, future, time.monotonic()))
+            futures.append(future)
+        return futures
+    
+    async def send(self, entity, text):
+        """Queue a message and wait until all of its chunks are delivered"""
+        await asyncio.gather(*self.enqueue(entity, text))
+    
+    def ensure_worker(self):
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.run())
+    
+    def metrics(self):
+        """Queue depth, send latency and counters"""
+        latencies = list(self.latencies)
+        return dict(
+            self.stats,
+            queue_depth=self.queue.qsize(),
+            avg_latency=sum(latencies) / len(latencies) if latencies else 0.0,
+            max_latency=max(latencies) if latencies else 0.0,
+        )
+    
+    async def wait_for_slot(self, chat_id):
+        """Sleep until both the per-chat and the global pacing allow a send"""
+        now = time.monotonic()
+        ready_at = max(self.last_sent + self.global_interval,
+                       self.last_sent_per_chat.get(chat_id, 0.0) + self.per_chat_interval)
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+    
+    async def run(self):
+        while True:
+            entity, text, future, enqueued_at = await self.queue.get()
+            try:
+                await self.deliver(entity, text)
+                self.stats['sent'] += 1
+                self.latencies.append(time.monotonic() - enqueued_at)
+                if not future.done():
+                    future.set_result(None)
+            except Exception as e:
+                self.stats['failed'] += 1
+                logger.error(f"Giving up on outbound message: {str(e)}")
+                if self.on_failure:
+                    self.on_failure(text, e)
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+    
+    async def deliver(self, entity, text):
+        """Send one chunk, honouring FloodWait and retrying transient errors"""
+        chat_id = getattr(entity, 'id', entity)
+        attempt = 0
+        while True:
+            await self.wait_for_slot(chat_id)
+            try:
+                await self.client.send_message(entity=entity, message=text)
+                self.mark_sent(chat_id)
+                return
+            except FloodWaitError as e:
+                # Telegram rejected the request outright, so resending cannot duplicate it
+                self.stats['flood_waits'] += 1
+                self.stats['flood_wait_seconds'] += e.seconds
+                logger.warning(f"FloodWait: sleeping {e.seconds}s before resending")
+                await asyncio.sleep(e.seconds)
+            except asyncio.TimeoutError:
+                self.mark_sent(chat_id)
+                raise  # Telegram may have delivered it: resending could post the chunk twice
+            except (ConnectionError, OSError) as e:
+                self.mark_sent(chat_id)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.stats['retries'] += 1
+                logger.warning(f"Send failed ({str(e)}), retry {attempt}/{self.max_retries}")
+                await asyncio.sleep(2 ** attempt)
+    
+    def mark_sent(self, chat_id):
+        now = time.monotonic()
+        self.last_sent = now
+        self.last_sent_per_chat[chat_id] = now
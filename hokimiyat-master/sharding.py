@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def shard_for(group_key, shards):
+    """Stable shard of a group (the same in every process and across restarts)"""
+    return zlib.crc32(str(group_key).encode('utf-8')) % shards
+
+class DailyAggregator:
+    """Per-day, per-group totals of classified messages; mergeable across shards"""
+    
+    def __init__(self, days_kept=2):
+        self.days_kept = days_kept
+        self.totals = {}  # (day, group_name) -> totals dict
+    
+    def add(self, group_name, epoch, features):
+        day = datetime.fromtimestamp(epoch).date().isoformat()
+        totals = self.totals.get((day, group_name))
+        if totals is None:
+            totals = self.totals[(day, group_name)] = {
+                'messages': 0, 'complaints': 0, 'sentiment_sum': 0.0, 'aggression_hits': 0, 'topics': Counter(),
+            }
+            days = sorted({key[0] for key in self.totals})
+            for old_day in days[:-self.days_kept]:
+                for key in [key for key in self.totals if key[0] == old_day]:
+                    del self.totals[key]
+        totals['messages'] += 1
+        totals['complaints'] += 1 if features['complaint'] else 0
+        totals['sentiment_sum'] += features['sentiment']
+        totals['aggression_hits'] += 1 if features['aggressive'] else 0
+        totals['topics'].update(features['topics'])
+    
+    def day(self, day):
+        """{group_name: totals} for one ISO day (copies, safe to read from another thread)"""
+        return {group_name: dict(totals, topics=Counter(totals['topics']))
+                for (totals_day, group_name), totals in list(self.totals.items()) if totals_day == day}
+
+def merge_totals(parts):
+    """Merge {group_name: totals} dicts from several shards"""
+    merged = defaultdict(lambda: {'messages': 0, 'complaints': 0, 'sentiment_sum': 0.0, 'aggression_hits': 0,
+                                  'topics': Counter()})
+    for part in parts:
+        for group_name, totals in part.items():
+            target = merged[group_name]
+            for key in ('messages', 'complaints', 'sentiment_sum', 'aggression_hits'):
+                target[key] += totals[key]
+            target['topics'].update(totals['topics'])
+    return dict(merged)
+
+def shard_worker(shard_id, inbox, outbox):
+    """
+    Worker process: does the per-message work that needs no shared state for
+    the messages of its groups (normalization, near-duplicate signature,
+    classification and the complaint cluster sketch), keeps their daily totals
+    and answers 'collect' requests from the coordinator.
+    """
+    from complaint_clusters import ComplaintClusters
+    from group_analyzer import analyzer
+    from near_duplicates import NearDuplicateIndex
+    from text_normalizer import normalize
+    # Same parameters as the coordinator's index and clusters, which only match the results
+    duplicates = NearDuplicateIndex()
+    clusters = ComplaintClusters()
+    aggregator = DailyAggregator()
+    while True:
+        command = inbox.get()
+        if command is None:
+            break
+        kind, payload = command
+        if kind == 'messages':
+            results = []
+            for key, group_name, epoch, text in payload:
+                text = normalize(text)
+                features = analyzer.classify_message(text)
+                aggregator.add(group_name, epoch, features)
+                sketch = clusters.sketch(text) if features['complaint'] else None
+                results.append((key, features, text, duplicates.signature(text), sketch))
+            outbox.put(('features', shard_id, results))
+        elif kind == 'collect':
+            request_id, day = payload
+            outbox.put(('totals', request_id, aggregator.day(day)))
+
+class ShardedClassifier:
+    """
+    Coordinator side of the sharded mode. Groups are hash-partitioned over
+    worker processes that prepare and classify messages and aggregate
+    per-group totals; the coordinator (which owns the Telegram connection)
+    gets each result back through `on_features(key, features, normalized,
+    duplicate_signature, cluster_sketch)` on the event loop, only matches it
+    against its shared indexes, and merges the shards' totals for reports.
+    """
+    
+    def __init__(self, shards, on_features, batch_size=50, batch_delay=0.05):
+        self.shards = shards
+        self.on_features = on_features
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay  # Longest a message waits for its batch to fill
+        self.context = multiprocessing.get_context('spawn')
+        self.inboxes = []
+        self.outbox = None
+        self.processes = []
+        self.buffers = [[] for _ in range(shards)]
+        self.flush_handle = None
+        self.requests = {}  # request_id -> (future, replies)
+        self.request_ids = itertools.count()
+        self.loop = None
+        self.reader = None
+        self.stats = {'submitted': 0, 'classified': 0, 'batches': 0}
+    
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.outbox = self.context.Queue()
+        for shard_id in range(self.shards):
+            inbox = self.context.Queue()
+            process = self.context.Process(target=shard_worker, args=(shard_id, inbox, self.outbox),
+                                           name=f"shard-{shard_id}", daemon=True)
+            process.start()
+            self.inboxes.append(inbox)
+            self.processes.append(process)
+        self.reader = threading.Thread(target=self.read_results, name='shard-reader', daemon=True)
+        self.reader.start()
+        logger.info(f"Started {self.shards} shard worker processes")
+    
+    def submit(self, key, group_name, epoch, text):
+        """Queue a message (its raw text) for its group's shard"""
+        shard = shard_for(group_name, self.shards)
+        buffer = self.buffers[shard]
+        buffer.append((key, group_name, epoch, text or ''))
+        self.stats['submitted'] += 1
+        if len(buffer) >= self.batch_size:
+            self.send(shard)
+        elif self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(self.batch_delay, self.flush)
+    
+    def send(self, shard):
+        batch, self.buffers[shard] = self.buffers[shard], []
+        if batch:
+            self.inboxes[shard].put(('messages', batch))
+            self.stats['batches'] += 1
+    
+    def flush(self):
+        """Send every partially filled batch"""
+        self.flush_handle = None
+        for shard in range(self.shards):
+            self.send(shard)
+    
+    def read_results(self):
+        """Reader thread: hand worker output to the event loop"""
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                break
+            try:
+                self.loop.call_soon_threadsafe(self.dispatch, item)
+            except RuntimeError:
+                break  # Event loop already closed (shutdown)
+    
+    def dispatch(self, item):
+        kind, tag, payload = item
+        if kind == 'features':
+            for key, *prepared in payload:
+                self.stats['classified'] += 1
+                self.on_features(key, *prepared)
+        elif kind == 'totals':
+            request = self.requests.get(tag)
+            if request is None:
+                return
+            future, replies = request
+            replies.append(payload)
+            if len(replies) == self.shards and not future.done():
+                del self.requests[tag]
+                future.set_result(merge_totals(replies))
+    
+    async def collect(self, day=None, timeout=10):
+        """Merged {group_name: totals} of all shards for a day (default today)"""
+        day = day or datetime.now().date().isoformat()
+        self.flush()
+        request_id = next(self.request_ids)
+        future = self.loop.create_future()
+        self.requests[request_id] = (future, [])
+        for inbox in self.inboxes:
+            inbox.put(('collect', (request_id, day)))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.requests.pop(request_id, None)
+    
+    async def drain(self, timeout=10):
+        """Wait until every submitted message has come back classified (or the timeout passes)"""
+        self.flush()
+        deadline = self.loop.time() + timeout
+        while self.stats['classified'] < self.stats['submitted'] and self.loop.time() < deadline:
+            await asyncio.sleep(0.05)
+    
+    def close(self):
+        self.flush()
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+        if self.outbox is not None:
+            self.outbox.put(None)
+    
+    def metrics(self):
+        return dict(self.stats, backlog=self.stats['submitted'] - self.stats['classified'])
@@ -0,0 +1,196 @@
+import hashlib
+import heapq
+import math
+import time
+from array import array
+from datetime import datetime
+
+def hash64(value):
+    """Stable 64-bit hash (the same across restarts and processes, unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HyperLogLog:
+    """
+    Distinct counter with fixed memory (2**precision bytes) and a relative
+    standard error of about 1.04 / sqrt(2**precision): ~3.3% at the default
+    precision of 10. Sketches with the same precision merge losslessly, so
+    per-group sketches combine into city-wide counts without double counting.
+    """
+    
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+    
+    @property
+    def error(self):
+        """Relative standard error of the estimate"""
+        return 1.04 / math.sqrt(self.size)
+    
+    def add(self, value):
+        x = hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def count(self):
+        """Estimated number of distinct values added"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * m:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = m * math.log(m / zeros)  # Linear counting for small sets
+        return int(round(estimate))
+    
+    def merge(self, other):
+        """Fold another sketch into this one (union of the counted sets)"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+    
+    def copy(self):
+        sketch = HyperLogLog(self.precision)
+        sketch.registers = bytearray(self.registers)
+        return sketch
+    
+    @classmethod
+    def union(cls, sketches, precision=10):
+        """New sketch counting the union of several sketches"""
+        result = cls(precision)
+        for sketch in sketches:
+            result.merge(sketch)
+        return result
+    
+    def __len__(self):
+        return self.count()
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters: tracks the most frequent items of a stream in
+    `capacity` counters. Any item seen more than N / capacity times is kept,
+    and each count overestimates by at most its recorded error.
+    Items are grouped in buckets by count (stream summary), so finding the
+    counter to replace is O(1) instead of a scan over all counters.
+    """
+    
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counts = {}  # item -> [count, error]
+        self.buckets = {}  # count -> items with that count, oldest first (dict as an ordered set)
+        self.min_count = 0
+        self.labels = {}  # item -> display label (e.g. sender name for a sender id)
+        self.total = 0
+    
+    def add(self, item, label=None, weight=1):
+        self.total += weight
+        entry = self.counts.get(item)
+        if entry is not None:
+            self.unlink(item, entry[0])
+        elif len(self.counts) < self.capacity:
+            entry = self.counts[item] = [0, 0]
+        else:
+            # Replace a smallest counter; the newcomer inherits its count as error
+            smallest = next(iter(self.buckets[self.min_count]))
+            self.unlink(smallest, self.min_count)
+            floor = self.counts.pop(smallest)[0]
+            self.labels.pop(smallest, None)
+            entry = self.counts[item] = [floor, floor]
+        entry[0] += weight
+        self.buckets.setdefault(entry[0], {})[item] = None
+        if self.min_count not in self.buckets:
+            # The smallest bucket emptied: with unit steps its items moved one up
+            self.min_count = entry[0] if weight == 1 else min(self.buckets)
+        elif entry[0] < self.min_count:
+            self.min_count = entry[0]
+        if label is not None:
+            self.labels[item] = label
+    
+    def unlink(self, item, count):
+        bucket = self.buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[count]
+    
+    def top(self, k):
+        """The k most frequent items as (item, count), highest first"""
+        return sorted(((item, entry[0]) for item, entry in self.counts.items()),
+                      key=lambda pair: pair[1], reverse=True)[:k]
+    
+    def label(self, item):
+        return self.labels.get(item, item)
+
+class TopK:
+    """Keeps the k highest-scoring items of a stream in a bounded min-heap"""
+    
+    def __init__(self, k=10):
+        self.k = k
+        self.heap = []
+        self.pushed = 0  # Tie-breaker so items themselves are never compared
+    
+    def add(self, score, item):
+        self.pushed += 1
+        entry = (score, self.pushed, item)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapq.heapreplace(self.heap, entry)
+    
+    def items(self):
+        """(score, item) pairs, highest score first"""
+        return [(score, item) for score, _, item in sorted(self.heap, reverse=True)]
+
+class RollingCounter:
+    """
+    Message counts in fixed time buckets on a ring (default 5-minute buckets
+    over 7 days). Memory is fixed per counter; stale buckets are recognised by
+    their bucket number, so idle periods need no reset. Window queries are
+    O(buckets).
+    """
+    
+    def __init__(self, bucket_seconds=300, window_seconds=7 * 86400):
+        self.bucket_seconds = bucket_seconds
+        self.size = window_seconds // bucket_seconds
+        self.counts = array('I', bytes(4 * self.size))
+        self.bucket_ids = array('i', [-1]) * self.size  # Bucket number stored in each slot
+    
+    def add(self, epoch=None, n=1):
+        bucket = int((epoch if epoch is not None else time.time()) // self.bucket_seconds)
+        slot = bucket % self.size
+        if self.bucket_ids[slot] != bucket:
+            self.bucket_ids[slot] = bucket
+            self.counts[slot] = 0
+        self.counts[slot] += n
+    
+    def copy(self):
+        counter = RollingCounter.__new__(RollingCounter)
+        counter.bucket_seconds = self.bucket_seconds
+        counter.size = self.size
+        counter.counts = array('I', self.counts)
+        counter.bucket_ids = array('i', self.bucket_ids)
+        return counter
+    
+    def count_since(self, since, now=None):
+        """Messages in buckets from `since` (epoch seconds) up to now"""
+        now = now if now is not None else time.time()
+        first = int(since // self.bucket_seconds)
+        last = int(now // self.bucket_seconds)
+        first = max(first, last - self.size + 1)
+        return sum(count for bucket, count in zip(self.bucket_ids, self.counts) if first <= bucket <= last)
+    
+    def last_hour(self, now=None):
+        now = now if now is not None else time.time()
+        return self.count_since(now - 3600, now)
+    
+    def today(self, now=None):
+        now = now if now is not None else time.time()
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        return self.count_since(midnight.timestamp(), now)
+    
+    def last_days(self, days=7, now=None):
+        now = now if now is not None else time.time()
+        return self.count_since(now - days * 86400, now)
@@ -3,24 +3,29 @@ import asyncio
 import logging
 from dotenv import load_dotenv
 from telethon import TelegramClient, events
-from collections import defaultdict, deque
+from telethon.utils import get_peer_id
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import re
+import sys
 import json
+import time
 from group_analyzer import analyzer
+from near_duplicates import NearDuplicateIndex
+from outbound_sender import OutboundSender
+from message_store import MessageStore
+from message_records import MessageRecord, group_ref
+from sketches import HyperLogLog, RollingCounter, SpaceSaving, TopK
+from group_table import GroupTable
+from sharding import DailyAggregator, ShardedClassifier
+from text_normalizer import join_normalized, normalized
+from complaint_clusters import ComplaintClusters
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("telegram_monitor.log"),
-        logging.StreamHandler()
-    ]
-)
+# Logging is configured in setup(): shard worker processes import this module and must not open the log file
 logger = logging.getLogger(__name__)
 
 # Telegram API credentials
@@ -31,26 +36,173 @@ PHONE = os.getenv('TELEGRAM_PHONE', '')          # Default to empty string if no
 # Results group name (where all analysis will be sent)
 RESULTS_GROUP = "MFY Info Fergana Sh"  # Change this to your actual results group name
 
-# Create Telegram client
-client = TelegramClient('session_name', API_ID, API_HASH)
+# Telegram client, created by setup() (opening it touches the session database)
+client = None
+
+# Hot per-group state, bounded in memory: idle groups are spilled to compressed files
+# and reloaded on their next message or report
+GROUP_IDLE_SECONDS = int(os.getenv('GROUP_IDLE_SECONDS', str(6 * 3600)))
+GROUP_MESSAGES_MEMORY_MB = int(os.getenv('GROUP_MESSAGES_MEMORY_MB', '256'))
+GROUP_STATS_MEMORY_MB = int(os.getenv('GROUP_STATS_MEMORY_MB', '64'))
+GROUP_SPILL_DIR = os.getenv('GROUP_SPILL_DIR', 'group_spill')
+GROUP_EVICTION_INTERVAL = 300  # seconds
+MESSAGE_RECORD_BYTES = 500  # Rough size of a stored MessageRecord with its text and normalized text
+
+def new_group_stats():
+    return {
+        'total_messages': 0,
+        'activity': RollingCounter(),  # 5-minute buckets over 7 days
+        'active_users': {},  # ISO day -> HyperLogLog of sender ids
+        'last_updated': None
+    }
+
+def group_stats_size(stats):
+    activity = stats['activity']
+    sketch_bytes = sum(len(sketch.registers) for sketch in stats['active_users'].values())
+    return activity.size * 8 + sketch_bytes + 512
 
 # Store messages for each group (last 200 messages for better analysis)
-group_messages = defaultdict(lambda: deque(maxlen=200))
-group_stats = defaultdict(lambda: {
-    'total_messages': 0,
-    'today_messages': 0,
-    'active_users': set(),
-    'last_updated': None
-})
+group_messages = GroupTable('messages', lambda: deque(maxlen=200), lambda messages: len(messages) * MESSAGE_RECORD_BYTES,
+                            GROUP_IDLE_SECONDS, GROUP_MESSAGES_MEMORY_MB * 1024 * 1024, GROUP_SPILL_DIR)
+group_stats = GroupTable('stats', new_group_stats, group_stats_size,
+                         GROUP_IDLE_SECONDS, GROUP_STATS_MEMORY_MB * 1024 * 1024, GROUP_SPILL_DIR)
+
+# Distinct active users: per-group, per-day HyperLogLog sketches (mergeable across groups)
+ACTIVE_USER_PRECISION = int(os.getenv('ACTIVE_USER_PRECISION', '10'))  # 2**p bytes, ~1.04/sqrt(2**p) error
+ACTIVE_USER_DAYS = int(os.getenv('ACTIVE_USER_DAYS', '7'))  # Days of sketches kept per group
+
+# Streaming rankings updated on ingestion: most active groups and senders (Space-Saving)
+# and the highest-priority complaints (bounded heap), kept for today and yesterday
+LEADER_CAPACITY = int(os.getenv('LEADER_CAPACITY', '500'))  # counters per ranking
+CRITICAL_COMPLAINTS_KEPT = 10
+daily_leaders = {}  # ISO day -> {'groups', 'senders', 'complaints'}
+
+# Persistent message history; group_messages above stays as the hot cache
+MESSAGE_DB_PATH = os.getenv('MESSAGE_DB_PATH', 'messages.db')
+MESSAGE_FLUSH_INTERVAL = int(os.getenv('MESSAGE_FLUSH_INTERVAL', '5'))  # seconds
+message_store = None  # MessageStore, opened by setup()
+
+# Near-duplicate index across all groups (forwarded announcements, copy-pasted complaints)
+duplicate_index = NearDuplicateIndex()
+
+# Complaints from all groups clustered into tracked issues as they arrive (ids survive restarts)
+COMPLAINT_CLUSTERS_FILE = os.getenv('COMPLAINT_CLUSTERS_FILE', 'complaint_clusters.json')
+COMPLAINT_CLUSTERS_SAVE_INTERVAL = 300  # seconds
+CLUSTERS_IN_REPORT = 5
+complaint_clusters = ComplaintClusters()
+analyzer.complaint_clusters = complaint_clusters
 
 # Track overall statistics
 overall_stats = {
     'total_groups': 0,
-    'total_messages': 0,
-    'today_messages': 0,
-    'active_groups_today': 0
+    'total_messages': 0
 }
 
+# Sharded mode: MONITOR_SHARDS > 1 hash-partitions groups over worker processes that normalize,
+# sign and classify messages and keep per-group daily totals; this process keeps the Telegram
+# connection and only matches the results against the shared duplicate index and clusters
+MONITOR_SHARDS = int(os.getenv('MONITOR_SHARDS', '0'))
+shard_pool = None  # ShardedClassifier, started in main() when MONITOR_SHARDS > 1
+shard_pending = {}  # (group_id, message_id) -> record waiting for its shard's features
+daily_totals = DailyAggregator()  # In-process totals when not sharded
+
+# Government report: built off the event loop, single-flight, short-lived snapshot
+REPORT_MAX_AGE = int(os.getenv('REPORT_MAX_AGE', '60'))  # seconds
+report_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='report')
+latest_report = {'text': None, 'generated_at': None, 'version': 0, 'group_reports': None}
+report_in_flight = None  # Future of the build currently running, shared by all callers
+store_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='store')  # SQLite writes, in order
+store_flush_in_flight = None  # Size-triggered flush currently running
+
+def parse_schedule(spec):
+    """Parse a cron-like daily schedule "HH:MM,HH:MM,..." into sorted (hour, minute) pairs"""
+    times = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        hour, minute = part.split(':')
+        times.append((int(hour) % 24, int(minute) % 60))
+    return sorted(set(times))
+
+# Scheduled report snapshots: built at fixed times, served to @get_info with their age
+REPORT_SCHEDULE = parse_schedule(os.getenv('REPORT_SCHEDULE', '08:00,13:00,18:00'))
+REPORT_SCHEDULE_AI = os.getenv('REPORT_SCHEDULE_AI', '0') == '1'  # Also run per-group AI analyses
+REPORT_SNAPSHOT_MAX_AGE = int(os.getenv('REPORT_SNAPSHOT_MAX_AGE', str(24 * 3600)))  # seconds
+REPORT_SNAPSHOT_DIR = 'report_snapshots'
+REPORT_SNAPSHOT_KEEP = int(os.getenv('REPORT_SNAPSHOT_KEEP', '30'))
+
+# Invite link cache: resolved once per chat, persisted, refreshed lazily in the background
+INVITE_LINKS_FILE = 'invite_links.json'
+INVITE_LINK_TTL = timedelta(days=int(os.getenv('INVITE_LINK_TTL_DAYS', '7')))
+invite_links = {}  # str(chat_id) -> {'link': ..., 'resolved_at': iso timestamp}
+invite_link_tasks = {}  # chat_id -> in-flight refresh task
+invite_link_semaphore = asyncio.Semaphore(1)  # Resolve one link at a time to avoid FloodWait
+
+# Gap recovery: last processed message id per group, persisted; missed history is fetched at startup
+CHECKPOINTS_FILE = 'checkpoints.json'
+CATCHUP_CONCURRENCY = int(os.getenv('CATCHUP_CONCURRENCY', '3'))  # Groups fetched in parallel
+CATCHUP_MAX_MESSAGES = int(os.getenv('CATCHUP_MAX_MESSAGES', '2000'))  # Per group
+CATCHUP_REQUEST_INTERVAL = float(os.getenv('CATCHUP_REQUEST_INTERVAL', '1'))  # seconds between history requests
+checkpoints = {}  # str(chat_id) -> last processed message id
+checkpoints_dirty = False
+catchup_targets = {}  # chat_id -> checkpoint loaded at startup, until the group's catch-up is done
+held_checkpoints = {}  # chat_id -> newest message id ingested while the group still has a gap
+catchup_running = False
+live_first_ids = {}  # chat_id -> first live message id seen while catching up
+catchup_stats = {}
+
+def load_invite_links():
+    """Load cached invite links from disk"""
+    try:
+        with open(INVITE_LINKS_FILE, 'r', encoding='utf-8') as f:
+            invite_links.update(json.load(f))
+        logger.info(f"Loaded {len(invite_links)} cached invite links")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not load invite link cache: {str(e)}")
+
+def save_invite_links():
+    """Write the invite link cache to disk atomically"""
+    try:
+        tmp_file = INVITE_LINKS_FILE + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(invite_links, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, INVITE_LINKS_FILE)
+    except Exception as e:
+        logger.warning(f"Could not save invite link cache: {str(e)}")
+
+def fallback_group_link(chat_id):
+    """t.me link that works for members without any API call"""
+    return f"https://t.me/c/{str(chat_id).replace('-100', '')}"
+
+def cached_group_link(chat):
+    """
+    Return the group link without any network call.
+    Missing or stale links are refreshed in the background.
+    """
+    entry = invite_links.get(str(chat.id))
+    if entry is None or datetime.now() - datetime.fromisoformat(entry['resolved_at']) > INVITE_LINK_TTL:
+        schedule_invite_link_refresh(chat)
+    return entry['link'] if entry else fallback_group_link(chat.id)
+
+def schedule_invite_link_refresh(chat):
+    """Start a background refresh for a chat unless one is already running"""
+    if chat.id in invite_link_tasks:
+        return
+    invite_link_tasks[chat.id] = asyncio.create_task(refresh_invite_link(chat))
+
+async def refresh_invite_link(chat):
+    """Resolve and cache the invite link of a chat"""
+    try:
+        async with invite_link_semaphore:
+            link = await get_group_invite_link(chat)
+        invite_links[str(chat.id)] = {'link': link, 'resolved_at': datetime.now().isoformat()}
+        save_invite_links()
+    finally:
+        invite_link_tasks.pop(chat.id, None)
+
 async def get_group_invite_link(chat):
     """Generate an invite link for the group"""
     try:
@@ -65,104 +217,490 @@ async def get_group_invite_link(chat):
         return invite.link
     except Exception as e:
         logger.warning(f"Could not get invite link for chat {chat.id}: {str(e)}")
-        return f"https://t.me/c/{str(chat.id).replace('-100', '')}"  # Fallback to t.me link
+        return fallback_group_link(chat.id)  # Fallback to t.me link
+
+# Entity caches so the message path and report sending avoid Telethon lookups
+# Optional whitelist of monitored group ids (marked ids, e.g. -1001234567890); empty = all groups
+MONITORED_CHAT_IDS = {int(chat_id) for chat_id in os.getenv('MONITORED_CHAT_IDS', '').split(',') if chat_id.strip()}
+REPORT_COMMAND_PATTERN = re.compile(r'(?is).*@get_(info|week|month)')
+ENTITY_REFRESH_INTERVAL = int(os.getenv('ENTITY_REFRESH_INTERVAL', '3600'))  # seconds
+MAX_CACHED_SENDERS = 50000
+# Keyed by marked peer id (get_peer_id, e.g. -100... for megagroups), the form of event.chat_id/sender_id
+chat_cache = {}  # peer id -> chat entity
+sender_cache = OrderedDict()  # peer id -> user entity, least recently seen first
+sender_lookups = {}  # sender id -> in-flight get_sender() task, shared by all of that sender's messages
+results_group_entity = None
+results_group_is_fallback = False  # True when reports go to the first available group instead
+
+def remember_sender(sender):
+    """Add a sender to the bounded sender cache"""
+    peer_id = get_peer_id(sender)
+    sender_cache[peer_id] = sender
+    sender_cache.move_to_end(peer_id)
+    if len(sender_cache) > MAX_CACHED_SENDERS:
+        sender_cache.popitem(last=False)
+
+async def resolve_chat(event):
+    """Chat of an event: from the update itself, the cache, or (last resort) the API"""
+    chat = event.chat or chat_cache.get(event.chat_id)
+    if chat is None:
+        chat = await event.get_chat()
+    if chat is not None:
+        chat_cache[get_peer_id(chat)] = chat
+    return chat
+
+def sender_display_name(sender):
+    """Name shown for a sender (users have names, anonymous admins post as the chat)"""
+    return (getattr(sender, 'first_name', None) or getattr(sender, 'username', None)
+            or getattr(sender, 'title', None) or "Unknown")
+
+def known_sender(event):
+    """Sender of an event if it is already at hand (in the update or the cache); never calls the API"""
+    sender = event.sender or sender_cache.get(event.sender_id)
+    if sender is not None:
+        remember_sender(sender)
+    return sender
+
+def resolve_sender_later(event, record):
+    """
+    Fill in the stored record once a sender missing from the update and the cache is fetched.
+    A burst from the same unknown sender waits on one get_sender() call instead of one each.
+    """
+    task = sender_lookups.get(event.sender_id)
+    if task is None:
+        task = sender_lookups[event.sender_id] = asyncio.create_task(fetch_sender(event))
+    task.add_done_callback(lambda done: fill_sender(record, done))
+
+async def fetch_sender(event):
+    try:
+        sender = await event.get_sender()
+        if sender is not None:
+            remember_sender(sender)
+        return sender
+    except Exception as e:
+        logger.warning(f"Could not resolve sender {event.sender_id}: {str(e)}")
+        return None
+    finally:
+        sender_lookups.pop(event.sender_id, None)
+
+def fill_sender(record, task):
+    if not task.cancelled() and task.result() is not None:
+        record.sender = sys.intern(sender_display_name(task.result()))
+
+def is_monitored_group(event):
+    """Event filter: group messages only, from the whitelist when one is configured"""
+    return event.is_group and (not MONITORED_CHAT_IDS or event.chat_id in MONITORED_CHAT_IDS)
+
+async def resolve_results_group():
+    """Find the results group entity: by name first, then by dialog title"""
+    global results_group_entity, results_group_is_fallback
+    try:
+        results_group_entity = await client.get_entity(RESULTS_GROUP)
+        results_group_is_fallback = False
+        return results_group_entity
+    except Exception as e:
+        logger.warning(f"Could not find group by username, trying by title: {str(e)}")
+    
+    dialogs = await client.get_dialogs()
+    for dialog in dialogs:
+        if hasattr(dialog.entity, 'title') and dialog.entity.title == RESULTS_GROUP:
+            results_group_entity = dialog.entity
+            results_group_is_fallback = False
+            return results_group_entity
+    
+    # If still not found, fall back to the first available group
+    for dialog in dialogs:
+        if hasattr(dialog.entity, 'title'):
+            results_group_entity = dialog.entity
+            results_group_is_fallback = True
+            return results_group_entity
+    return None
+
+async def warm_entity_cache():
+    """Load all group chats and the results group in one dialog fetch"""
+    global results_group_entity, results_group_is_fallback
+    dialogs = await client.get_dialogs()
+    for dialog in dialogs:
+        if hasattr(dialog.entity, 'title'):
+            chat_cache[get_peer_id(dialog.entity)] = dialog.entity
+            if dialog.entity.title == RESULTS_GROUP:
+                results_group_entity = dialog.entity
+                results_group_is_fallback = False
+    if results_group_entity is None:
+        await resolve_results_group()
+    logger.info(f"Entity cache warmed: {len(chat_cache)} chats, results group "
+                f"{'found' if results_group_entity and not results_group_is_fallback else 'not found'}")
+
+async def refresh_entity_cache_periodically():
+    """Re-warm the entity cache on a schedule so renamed or new groups are picked up"""
+    while True:
+        await asyncio.sleep(ENTITY_REFRESH_INTERVAL)
+        try:
+            await warm_entity_cache()
+        except Exception as e:
+            logger.warning(f"Entity cache refresh failed: {str(e)}")
+
+async def flush_messages_periodically():
+    """Write buffered messages to the store even when traffic is low"""
+    while True:
+        await asyncio.sleep(MESSAGE_FLUSH_INTERVAL)
+        try:
+            # Checkpoints taken before the flush only cover messages that are stored
+            # or still buffered; a failed batch is re-buffered, so a failed flush
+            # raises before the snapshot is saved and it never runs ahead of the store
+            snapshot = dict(checkpoints)
+            await asyncio.get_running_loop().run_in_executor(store_executor, message_store.flush)
+            save_checkpoints(snapshot)
+        except Exception as e:
+            logger.error(f"Could not write messages to the store: {str(e)}")
+
+async def save_clusters_periodically():
+    """Persist the complaint clusters so their ids and counts survive a restart"""
+    while True:
+        await asyncio.sleep(COMPLAINT_CLUSTERS_SAVE_INTERVAL)
+        complaint_clusters.save(COMPLAINT_CLUSTERS_FILE)
+
+async def evict_idle_groups_periodically():
+    """Spill groups that went quiet to disk and log the group table metrics"""
+    while True:
+        await asyncio.sleep(GROUP_EVICTION_INTERVAL)
+        try:
+            evicted = group_messages.evict_idle() + group_stats.evict_idle()
+            if evicted:
+                logger.info(f"Spilled {evicted} idle group entries; messages: {group_messages.metrics()}, "
+                            f"stats: {group_stats.metrics()}")
+        except Exception as e:
+            logger.error(f"Could not evict idle groups: {str(e)}")
+
+def load_checkpoints():
+    """
+    Load per-group checkpoints from disk (before the client starts receiving updates)
+    and remember them as the catch-up targets
+    """
+    try:
+        if os.path.exists(CHECKPOINTS_FILE):
+            with open(CHECKPOINTS_FILE, 'r', encoding='utf-8') as f:
+                checkpoints.update(json.load(f))
+            logger.info(f"Loaded checkpoints for {len(checkpoints)} groups")
+    except Exception as e:
+        logger.warning(f"Could not load checkpoints: {str(e)}")
+    catchup_targets.update((int(chat_id), last_id) for chat_id, last_id in checkpoints.items())
+
+def save_checkpoints(snapshot=None):
+    """
+    Persist checkpoints (atomically) if they changed since the last save.
+    `snapshot` is a copy taken earlier, saved instead of the current ones.
+    """
+    global checkpoints_dirty
+    if not checkpoints_dirty:
+        return
+    data = checkpoints if snapshot is None else snapshot
+    try:
+        with open(CHECKPOINTS_FILE + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(CHECKPOINTS_FILE + '.tmp', CHECKPOINTS_FILE)
+        checkpoints_dirty = data != checkpoints
+    except Exception as e:
+        logger.warning(f"Could not save checkpoints: {str(e)}")
+
+def advance_checkpoint(chat_id, message_id):
+    global checkpoints_dirty
+    if chat_id in catchup_targets:
+        # The group's downtime gap is not recovered yet: hold the checkpoint back
+        if message_id is not None and message_id > held_checkpoints.get(chat_id, 0):
+            held_checkpoints[chat_id] = message_id
+        return
+    key = str(chat_id)
+    if message_id is not None and message_id > checkpoints.get(key, 0):
+        checkpoints[key] = message_id
+        checkpoints_dirty = True
+
+async def catch_up_group(chat, last_id, semaphore):
+    """Feed a group's messages newer than its checkpoint through the normal ingestion path"""
+    recovered = 0
+    lag = 0.0
+    async with semaphore:
+        async for message in client.iter_messages(chat, min_id=last_id, reverse=True, limit=CATCHUP_MAX_MESSAGES,
+                                                  wait_time=CATCHUP_REQUEST_INTERVAL):
+            first_live = live_first_ids.get(chat.id)
+            if first_live is not None and message.id >= first_live:
+                break  # Already received live
+            if getattr(message, 'action', None) is not None:
+                continue  # Service message (joins, pins, ...)
+            epoch = message.date.timestamp()
+            lag = max(lag, time.time() - epoch)
+            ingest_message(message, chat, epoch)
+            recovered += 1
+    if recovered >= CATCHUP_MAX_MESSAGES:
+        logger.warning(f"Catch-up for '{chat.title}' stopped at {CATCHUP_MAX_MESSAGES} messages")
+    release_checkpoint(chat.id)
+    return recovered, lag
+
+def release_checkpoint(chat_id):
+    """The group's gap is recovered: let its checkpoint advance to what was ingested meanwhile"""
+    catchup_targets.pop(chat_id, None)
+    advance_checkpoint(chat_id, held_checkpoints.pop(chat_id, None))
+
+async def catch_up_missed_messages():
+    """
+    Fetch history missed while the monitor was down, for every group with a
+    checkpoint, in parallel under CATCHUP_CONCURRENCY and CATCHUP_REQUEST_INTERVAL.
+    Logs throughput and how far behind the oldest recovered message was.
+    """
+    global catchup_running
+    # Checkpoints use the bare chat id (chat.id), the cache the marked peer id
+    chats = {chat.id: chat for chat in chat_cache.values()}
+    targets = [(chats[chat_id], last_id) for chat_id, last_id in catchup_targets.items() if chat_id in chats]
+    for chat_id in [chat_id for chat_id in catchup_targets if chat_id not in chats]:
+        release_checkpoint(chat_id)  # No longer a member: nothing to fetch
+    if not targets:
+        catchup_running = False
+        return
+    semaphore = asyncio.Semaphore(CATCHUP_CONCURRENCY)
+    started = time.monotonic()
+    try:
+        results = await asyncio.gather(*(catch_up_group(chat, last_id, semaphore) for chat, last_id in targets),
+                                       return_exceptions=True)
+    finally:
+        catchup_running = False
+    
+    recovered = sum(result[0] for result in results if not isinstance(result, BaseException))
+    failed = sum(1 for result in results if isinstance(result, BaseException))
+    max_lag = max((result[1] for result in results if not isinstance(result, BaseException)), default=0.0)
+    elapsed = time.monotonic() - started
+    catchup_stats.update({
+        'groups': len(targets),
+        'failed_groups': failed,
+        'messages': recovered,
+        'seconds': elapsed,
+        'messages_per_second': recovered / elapsed if elapsed else 0.0,
+        'max_lag_seconds': max_lag,
+    })
+    logger.info(f"Catch-up finished: {recovered} messages from {len(targets)} groups in {elapsed:.1f}s "
+                f"({catchup_stats['messages_per_second']:.1f} msg/s), oldest was {max_lag / 60:.0f} min behind, "
+                f"{failed} groups failed")
+    if failed:
+        logger.warning(f"Checkpoints of {failed} failed groups are kept, so their gap is fetched again on the next start")
+
+def record_active_user(stats, sender_key, day=None):
+    """Count a sender in the group's sketch for the day, dropping sketches older than ACTIVE_USER_DAYS"""
+    day = day or datetime.now().date().isoformat()
+    sketches = stats['active_users']
+    sketch = sketches.get(day)
+    if sketch is None:
+        sketch = sketches[day] = HyperLogLog(ACTIVE_USER_PRECISION)
+        for old_day in sorted(sketches)[:-ACTIVE_USER_DAYS]:
+            del sketches[old_day]
+    sketch.add(sender_key)
+
+def leaders_for(day):
+    """
+    Rankings for a day, created on first use; only the two newest days are kept.
+    Returns None for days before yesterday (e.g. old history recovered by catch-up).
+    """
+    leaders = daily_leaders.get(day)
+    if leaders is None:
+        if day < (datetime.now().date() - timedelta(days=1)).isoformat():
+            return None
+        leaders = daily_leaders[day] = {
+            'groups': SpaceSaving(LEADER_CAPACITY),
+            'senders': SpaceSaving(LEADER_CAPACITY),
+            'complaints': TopK(CRITICAL_COMPLAINTS_KEPT),
+        }
+        # Evict the oldest day, not the first inserted (ISO dates sort by date)
+        while len(daily_leaders) > 2:
+            del daily_leaders[min(daily_leaders)]
+    return leaders
+
+def update_leaders(message, features):
+    """Feed one stored message into its day's rankings (today or yesterday)"""
+    leaders = leaders_for(datetime.fromtimestamp(message.epoch).date().isoformat())
+    if leaders is None:
+        return
+    leaders['groups'].add(message.group_name)
+    leaders['senders'].add(message.sender_id or message.sender, label=message.sender)
+    # Near-duplicates are ranked once, through the first copy (its group list is live)
+    if features['complaint'] and message.dup_key == (message.group_id, message.id):
+        leaders['complaints'].add((features['priority'], -features['sentiment'], message.epoch), message)
+
+def active_users_today(stats_by_group):
+    """Distinct senders today across the given groups (one sketch union, no double counting)"""
+    today = datetime.now().date().isoformat()
+    sketches = [stats['active_users'][today] for stats in stats_by_group.values() if today in stats['active_users']]
+    return HyperLogLog.union(sketches, ACTIVE_USER_PRECISION).count() if sketches else 0
+
+def ingest_message(message, chat, epoch=None):
+    """
+    Common ingestion path for live events and recovered history: update the
+    stats, store the record and feed the rankings. `epoch` is the message time
+    (defaults to now). Returns the stored MessageRecord.
+    """
+    group_name = chat.title
+    # Sender from the update or the cache; otherwise resolved in the background
+    sender = known_sender(message)
+    sender_name = sender_display_name(sender) if sender is not None else "Unknown"
+    
+    # Update overall and group stats (time windows come from the bucket counters)
+    now = epoch if epoch is not None else time.time()
+    overall_stats['total_groups'] = len(group_messages)
+    overall_stats['total_messages'] += 1
+    stats = group_stats[group_name]
+    stats['total_messages'] += 1
+    stats['activity'].add(now)
+    stats['last_updated'] = datetime.now()
+    record_active_user(stats, message.sender_id if message.sender_id is not None else f"name:{sender_name}",
+                       day=datetime.fromtimestamp(now).date().isoformat())
+    
+    # Group invite link from the cache (resolved in the background when missing)
+    group_link = cached_group_link(chat)
+    
+    # Store a compact record: group fields shared per group, epoch seconds, interned sender
+    message_data = MessageRecord(
+        text=message.text,
+        sender=sender_name,
+        sender_id=message.sender_id,
+        group=group_ref(group_name, chat.id if hasattr(chat, 'id') else None, group_link),
+        epoch=now,
+        id=message.id,
+        is_forwarded=message.forward is not None,
+        reply_to_msg_id=message.reply_to_msg_id if hasattr(message, 'reply_to_msg_id') else None
+    )
+    
+    if sender is None and message.sender_id is not None:
+        resolve_sender_later(message, message_data)
+    
+    group_messages[group_name].append(message_data)
+    if shard_pool is not None:
+        # Normalized, signed and classified by the group's shard; see on_shard_features
+        key = (message_data.group_id, message_data.id)
+        shard_pending[key] = message_data
+        shard_pool.submit(key, group_name, now, message_data.text)
+    else:
+        # Normalized once here; duplicate detection and classification reuse it
+        tag_duplicates(message_data)
+        features = analyzer.classify_message(message_data)
+        daily_totals.add(group_name, now, features)
+        apply_features(message_data, features)
+    return message_data
+
+def tag_duplicates(message_data, signature=None):
+    """Tag near-duplicates: all copies share the canonical key and its live group list"""
+    dup_key = duplicate_index.add((message_data.group_id, message_data.id), message_data.normalized,
+                                  message_data.group_name, signature)
+    message_data.dup_key = dup_key
+    message_data.dup_groups = duplicate_index.groups(dup_key)
+
+def apply_features(message_data, features, cluster_sketch=None):
+    """Store a classified message, cluster it if it is a complaint and feed it into the rankings"""
+    if features['complaint']:
+        message_data.cluster_id = complaint_clusters.add(message_data, features['topics'], features['priority'],
+                                                         cluster_sketch)
+    if message_store.add(message_data, features):
+        flush_store_in_background()
+    # Only now, so a checkpoint never passes a message still waiting for its shard's features
+    advance_checkpoint(message_data.group_id, message_data.id)
+    update_leaders(message_data, features)
+
+def flush_store_in_background():
+    """Write a full batch on the store thread, one flush at a time"""
+    global store_flush_in_flight
+    if store_flush_in_flight is None or store_flush_in_flight.done():
+        store_flush_in_flight = asyncio.get_running_loop().run_in_executor(store_executor, message_store.flush)
+        store_flush_in_flight.add_done_callback(log_store_flush_error)
+
+def log_store_flush_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Could not write messages to the store (kept for the next flush): {str(future.exception())}")
+
+def on_shard_features(key, features, normalized_text, duplicate_signature, cluster_sketch):
+    """
+    A message prepared by a shard worker (called on the event loop): only the
+    matching against the shared duplicate index and complaint clusters is left
+    """
+    message_data = shard_pending.pop(key, None)
+    if message_data is not None:
+        message_data.norm = normalized_text
+        tag_duplicates(message_data, duplicate_signature)
+        apply_features(message_data, features, cluster_sketch)
+
+async def collect_daily_totals():
+    """Today's per-group totals: merged from the shards, or from this process"""
+    if shard_pool is not None:
+        try:
+            return await shard_pool.collect()
+        except Exception as e:
+            logger.warning(f"Could not collect shard totals: {str(e)}")
+            return None
+    return daily_totals.day(datetime.now().date().isoformat())
 
 async def handler(event):
     """
     Handle new messages in groups - Continuous monitoring
     """
     try:
-        # Get chat information
-        chat = await event.get_chat()
-        sender = await event.get_sender()
+        # Get chat information (cached, no API call in the common case)
+        chat = await resolve_chat(event)
         
-        # Only process group messages
+        # Only process group messages (the event filter already drops private chats and channels)
         if hasattr(chat, 'title'):
-            group_name = chat.title
-            sender_name = sender.first_name if sender.first_name else sender.username if sender.username else "Unknown"
-            
-            # Update overall stats
-            overall_stats['total_groups'] = len(group_messages)
-            overall_stats['total_messages'] += 1
-            
-            # Check if message is from today
-            message_date = datetime.now().date()
-            if group_stats[group_name]['last_updated'] is None or \
-               group_stats[group_name]['last_updated'].date() != message_date:
-                group_stats[group_name]['today_messages'] = 0
-                group_stats[group_name]['last_updated'] = datetime.now()
-            
-            # Update group stats
-            group_stats[group_name]['total_messages'] += 1
-            group_stats[group_name]['today_messages'] += 1
-            group_stats[group_name]['active_users'].add(sender_name)
-            group_stats[group_name]['last_updated'] = datetime.now()
-            
-            # Get or create group invite link
-            group_link = await get_group_invite_link(chat)
-            
-            # Store message with comprehensive information
-            message_data = {
-                'text': event.text,
-                'sender': sender_name,
-                'sender_id': sender.id if hasattr(sender, 'id') else None,
-                'group_name': group_name,
-                'group_id': chat.id if hasattr(chat, 'id') else None,
-                'group_link': group_link,
-                'timestamp': datetime.now().isoformat(),
-                'id': event.id,
-                'is_forwarded': event.forward is not None,
-                'reply_to_msg_id': event.reply_to_msg_id if hasattr(event, 'reply_to_msg_id') else None
-            }
-            
-            group_messages[group_name].append(message_data)
-            
-            logger.info(f"New message in '{group_name}' from '{sender_name}': {event.text[:50]}...")
+            # History before the first live message of a group is left to the catch-up
+            if catchup_running:
+                live_first_ids.setdefault(chat.id, event.id)
+            record = ingest_message(event, chat)
+            logger.info(f"New message in '{record.group_name}' from '{record.sender}': {event.text[:50]}...")
             
             # Check if someone is requesting analysis
             if event.text and '@get_info' in event.text.lower():
                 try:
-                    # Generate comprehensive government-level report
-                    gov_report = await generate_government_report()
+                    # Serve the latest scheduled snapshot, or build the report on demand
+                    max_age = REPORT_SNAPSHOT_MAX_AGE if REPORT_SCHEDULE else None
+                    gov_report = await generate_government_report(max_age=max_age)
                     
                     if not gov_report:
                         gov_report = "Hech qanday ma'lumot topilmadi. Iltimos, bir muncha vaqt kuting va qayta urinib ko'ring."
+                    elif latest_report['generated_at']:
+                        gov_report = (f"🕒 Hisobot {format_report_age(latest_report['generated_at'])} tayyorlangan "
+                                      f"(versiya {latest_report['version']})\n\n" + gov_report)
                     
-                    # Send the report to the results group
-                    # Split long messages into chunks
-                    if len(gov_report) > 4000:
-                        chunks = [gov_report[i:i+4000] for i in range(0, len(gov_report), 4000)]
-                        for chunk in chunks:
-                            await send_to_results_group(chunk)
-                    else:
-                        await send_to_results_group(gov_report)
-                    logger.info("Sent government report to results group")
+                    # Queue the report for the results group (split and paced by the sender)
+                    await send_to_results_group(gov_report)
+                    logger.info(f"Queued government report for results group, outbound: {outbound.metrics()}")
                 except Exception as e:
                     error_msg = f"Xatolik yuz berdi: {str(e)}"
                     logger.error(f"Error generating/sending report: {str(e)}")
                     await send_to_results_group(error_msg)
+            
+            # Weekly / monthly district reports from the daily rollups
+            elif event.text and ('@get_week' in event.text.lower() or '@get_month' in event.text.lower()):
+                days = 7 if '@get_week' in event.text.lower() else 30
+                try:
+                    loop = asyncio.get_running_loop()
+                    period_report = await loop.run_in_executor(report_executor, build_period_report, days)
+                    await send_to_results_group(period_report)
+                except Exception as e:
+                    logger.error(f"Error generating/sending period report: {str(e)}")
+                    await send_to_results_group(f"Xatolik yuz berdi: {str(e)}")
                 
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
 
-def analyze_group_messages(group_name, messages):
+def analyze_group_messages(group_name, messages, ai_analysis=None, fallback=None):
     """
     Analyze messages in a group and generate a detailed report with issue tracking.
+    A precomputed AI analysis and fallback analysis (e.g. from a batched run) can be passed in.
     """
-    # Try to use AI analysis first
-    ai_analysis = analyzer.analyze_with_ai(group_name, messages)
-    
-    # Combine recent messages for analysis
-    all_text = " ".join([msg['text'] for msg in messages if msg['text']])
+    # Try to use AI analysis first (quiet groups get the fallback report)
+    if ai_analysis is None:
+        ai_analysis = analyzer.analyze_group(group_name, messages)
     
     # Use the fallback analyzer
-    sentiment_score = analyzer.analyze_sentiment(all_text)
-    topics = analyzer.extract_topics(all_text)
-    complaints = analyzer.detect_complaints(messages)
-    activity = analyzer.analyze_group_activity(messages)
-    
-    # Generate detailed recommendations
-    recommendations = analyzer.generate_detailed_recommendations(topics, complaints, activity)
+    if fallback is None:
+        fallback = analyzer.fallback_analysis(group_name, messages)
+    sentiment_score = fallback['sentiment_score']
+    topics = fallback['topics']
+    complaints = fallback['complaints']
+    activity = fallback['activity']
+    recommendations = fallback['recommendations']
     
     # Process complaints to include detailed information
     detailed_complaints = []
@@ -179,10 +717,16 @@ def analyze_group_messages(group_name, messages):
             'category': complaint.get('category', 'Boshqa'),
             'priority': complaint.get('priority', 2),  # Default to medium priority
             'status': 'Yangi',
-            'matched_terms': complaint.get('matched_terms', [])
+            'matched_terms': complaint.get('matched_terms', []),
+            'cluster_id': complaint.get('cluster_id')
         }
         detailed_complaints.append(detailed_complaint)
     
+    # Tracked issues behind the complaints (the same problem reported several times or in several groups)
+    cluster_ids = dict.fromkeys(c['cluster_id'] for c in detailed_complaints if c['cluster_id'] is not None)
+    issue_clusters = [cluster for cluster in map(complaint_clusters.summary, cluster_ids) if cluster]
+    issue_clusters.sort(key=lambda cluster: cluster['count'], reverse=True)
+    
     # Generate report
     report = {
         "group_name": group_name,
@@ -193,6 +737,7 @@ def analyze_group_messages(group_name, messages):
         "topics": topics,
         "total_complaints": len(complaints),
         "complaints": detailed_complaints,
+        "issue_clusters": issue_clusters,
         "activity": activity,
         "recommendations": recommendations,
         "ai_analysis_available": bool(ai_analysis)
@@ -204,6 +749,24 @@ def analyze_group_messages(group_name, messages):
     
     return report
 
+def analyze_all_groups(messages_by_group=None):
+    """
+    Analyze every monitored group, batching the AI requests across groups.
+    Pass a snapshot (see take_report_snapshot) when running off the event loop.
+    Returns {group_name: report}.
+    """
+    if messages_by_group is None:
+        messages_by_group = group_messages
+    groups = {name: list(messages) for name, messages in messages_by_group.items() if messages}
+    # Keyword analysis of every group first, spread over worker processes
+    fallbacks = analyzer.analyze_groups_fallback(groups)
+    ai_reports = analyzer.analyze_groups_with_ai(
+        groups, fallback_reports={name: result['report'] for name, result in fallbacks.items()})
+    return {
+        name: analyze_group_messages(name, messages, ai_analysis=ai_reports.get(name), fallback=fallbacks.get(name))
+        for name, messages in groups.items()
+    }
+
 def format_complaint_details(complaints):
     """Format detailed complaint information"""
     if not complaints:
@@ -222,13 +785,25 @@ def format_complaint_details(complaints):
             by_category[category] = []
         by_category[category].append(complaint)
     
-    # Display top complaints by category
+    # Display top complaints by category, one per complaint cluster
     for category, items in by_category.items():
         complaint_text += f"\n📝 {category.upper()} BO'YICHA MUAMMOLAR ({len(items)} ta):\n"
-        for i, complaint in enumerate(items[:3], 1):  # Show top 3 per category
+        cluster_counts = Counter(c.get('cluster_id') for c in items if c.get('cluster_id') is not None)
+        shown = []
+        seen_clusters = set()
+        for complaint in items:
+            cluster_id = complaint.get('cluster_id')
+            if cluster_id is not None:
+                if cluster_id in seen_clusters:
+                    continue
+                seen_clusters.add(cluster_id)
+            shown.append(complaint)
+        for i, complaint in enumerate(shown[:3], 1):  # Show top 3 per category
             priority_symbols = "🔴" * complaint.get('priority', 1)  # Visual priority indicator
+            repeats = cluster_counts.get(complaint.get('cluster_id'), 1)
+            repeated = f" (×{repeats}, muammo #{complaint['cluster_id']})" if repeats > 1 else ""
             complaint_text += (
-                f"{priority_symbols} {complaint.get('text', '')[:150]}...\n"
+                f"{priority_symbols} {complaint.get('text', '')[:150]}...{repeated}\n"
                 f"   👤 {complaint.get('sender', 'Noma\'lum')} • "
                 f"⏰ {complaint.get('timestamp', '')[:16]}\n"
                 f"   🔗 Guruh: {complaint.get('group_name', 'Noma\'lum')}\n\n"
@@ -236,12 +811,37 @@ def format_complaint_details(complaints):
     
     return complaint_text
 
-async def generate_government_report():
+def format_cluster(index, cluster, limit=3):
+    """One complaint cluster as a report entry"""
+    groups = cluster['groups']
+    names = ", ".join(groups[:limit]) + (f" (+{len(groups) - limit})" if len(groups) > limit else "")
+    first_seen = datetime.fromtimestamp(cluster['first_seen']).strftime('%Y-%m-%d %H:%M')
+    last_seen = datetime.fromtimestamp(cluster['last_seen']).strftime('%Y-%m-%d %H:%M')
+    return (
+        f"{index}. #{cluster['id']} [{cluster['category']}] {'🔴' * cluster['priority']} {cluster['text'][:100]}...\n"
+        f"   📨 {cluster['count']} ta murojaat • 🏘️ {len(groups)} ta MFY: {names}\n"
+        f"   ⏰ Birinchi: {first_seen} • oxirgi: {last_seen}\n\n"
+    )
+
+def format_group_names(message, limit=3):
+    """Group name of a message, or all groups a near-duplicate appeared in"""
+    groups = message.get('dup_groups') or [message.get('group_name', 'Noma\'lum')]
+    if len(groups) == 1:
+        return groups[0]
+    names = ", ".join(groups[:limit])
+    if len(groups) > limit:
+        names += f" (+{len(groups) - limit})"
+    return f"{names} — {len(groups)} ta guruhda"
+
+def build_government_report(messages_by_group, stats_by_group, leaders=None, totals_by_group=None):
     """
-    Generate a comprehensive government-level report with all required information
+    Generate a comprehensive government-level report with all required information.
+    Works on a snapshot of the monitor state, so it can run off the event loop.
     """
     try:
-        if not group_messages:
+        if leaders is None:
+            leaders = current_leaders()
+        if not messages_by_group:
             return "📊 HOZIRCHA GURUHLARDAN MA'LUMOT TO'PLAMADI\n\n" \
                    "🔄 Iltimos, bir muncha vaqt kuting va qayta urinib ko'ring."
         
@@ -252,36 +852,43 @@ async def generate_government_report():
         
         # Overall Statistics
         report += "📈 UMUMIY STATISTIKA:\n"
-        report += f"🏢 Monitoring qilinayotgan MFY guruhlari: {len(group_messages)} ta\n"
-        report += f"💬 Bugun qabul qilingan xabarlar: {sum(stats['today_messages'] for stats in group_stats.values())} ta\n"
-        report += f"📊 Jami to'plangan xabarlar: {sum(stats['total_messages'] for stats in group_stats.values())} ta\n"
-        report += f"👥 Bugun faol bo'lgan foydalanuvchilar: {sum(len(stats['active_users']) for stats in group_stats.values())} ta\n\n"
+        report += f"🏢 Monitoring qilinayotgan MFY guruhlari: {len(messages_by_group)} ta\n"
+        now = time.time()
+        report += f"💬 Bugun qabul qilingan xabarlar: {sum(stats['activity'].today(now) for stats in stats_by_group.values())} ta\n"
+        report += f"⏱️ Oxirgi soatda: {sum(stats['activity'].last_hour(now) for stats in stats_by_group.values())} ta • "
+        report += f"oxirgi 7 kunda: {sum(stats['activity'].last_days(7, now) for stats in stats_by_group.values())} ta\n"
+        report += f"📊 Jami to'plangan xabarlar: {sum(stats['total_messages'] for stats in stats_by_group.values())} ta\n"
+        report += f"👥 Bugun faol bo'lgan foydalanuvchilar: {active_users_today(stats_by_group)} ta\n"
+        if totals_by_group:
+            report += (f"⚠️ Bugungi shikoyatlar: {sum(t['complaints'] for t in totals_by_group.values())} ta • "
+                       f"💢 agressiv xabarlar: {sum(t['aggression_hits'] for t in totals_by_group.values())} ta\n")
+        report += "\n"
         
-        # Top 3 Most Active Groups
+        # Top 3 Most Active Groups (streaming ranking, no sort over all groups)
         report += "🏆 ENG FAOL 3 TA MFY GURUHI:\n"
-        sorted_groups = sorted(
-            [(name, stats) for name, stats in group_stats.items()], 
-            key=lambda x: x[1]['today_messages'], 
-            reverse=True
-        )[:3]
-        
-        for i, (group_name, stats) in enumerate(sorted_groups, 1):
+        for i, (group_name, count) in enumerate(leaders['top_groups'], 1):
+            stats = stats_by_group.get(group_name)
             report += (
                 f"{i}. 🏘️ {group_name}\n"
-                f"   💬 Bugun: {stats['today_messages']} xabar\n"
-                f"   👥 Faol foydalanuvchilar: {len(stats['active_users'])} ta\n\n"
+                f"   💬 Bugun: {count} xabar\n"
+                f"   👥 Faol foydalanuvchilar: {active_users_today({group_name: stats}) if stats else 0} ta\n\n"
             )
         
+        if leaders['top_senders']:
+            report += "👤 ENG FAOL FOYDALANUVCHILAR:\n"
+            for i, (sender, count) in enumerate(leaders['top_senders'], 1):
+                report += f"{i}. {sender} — {count} xabar\n"
+            report += "\n"
+        
         # Sentiment Analysis
         report += "📊 MAHALLA KAYFIYATI ANALIZI:\n"
         positive_groups = 0
         negative_groups = 0
         neutral_groups = 0
         
-        for group_name, messages in group_messages.items():
+        for group_name, messages in messages_by_group.items():
             if messages:
-                all_text = " ".join([msg['text'] for msg in messages if msg['text']])
-                sentiment = analyzer.analyze_sentiment(all_text)
+                sentiment = analyzer.analyze_sentiment(join_normalized(messages))
                 if sentiment > 0.2:
                     positive_groups += 1
                 elif sentiment < -0.2:
@@ -295,56 +902,48 @@ async def generate_government_report():
         
         # Critical Issues Section
         report += "⚠️ DOLZARB MUAMMOLAR:\n"
-        all_complaints = []
-        
-        for group_name, messages in group_messages.items():
-            if messages:
-                complaints = analyzer.detect_complaints(list(messages))
-                for complaint in complaints:
-                    complaint['group_name'] = group_name
-                    all_complaints.append(complaint)
-        
-        # Sort complaints by recency and priority
-        sorted_complaints = sorted(
-            all_complaints, 
-            key=lambda x: (datetime.fromisoformat(x.get('timestamp', datetime.now().isoformat())), 
-                          analyzer.analyze_sentiment(x.get('text', '')))
-        )
-        
-        # Show top critical issues
-        if sorted_complaints:
-            for i, complaint in enumerate(sorted_complaints[:10], 1):  # Top 10 issues
-                # Determine priority visually
+        # Highest-priority complaints, ranked on ingestion
+        if leaders['critical_complaints']:
+            for priority_level, complaint, cluster in leaders['critical_complaints']:
                 text = complaint.get('text', '')
-                priority_level = 1
-                if any(word in text.lower() for word in ['zudlik', 'zarur', 'shoshilinch', 'xavfli']):
-                    priority_level = 3
-                elif any(word in text.lower() for word in ['muhim', 'tezda', 'hal qilish']):
-                    priority_level = 2
-                
                 priority_symbols = "🔴" * priority_level
                 report += (
                     f"{priority_symbols} {text[:100]}...\n"
-                    f"   📍 MFY: {complaint.get('group_name', 'Noma\'lum')}\n"
+                    f"   📍 MFY: {format_group_names(complaint)}\n"
                     f"   👤 Muallif: {complaint.get('sender', 'Noma\'lum')}\n"
-                    f"   ⏰ Vaqt: {complaint.get('timestamp', '')[:16]}\n\n"
+                    f"   ⏰ Vaqt: {complaint.get('timestamp', '')[:16]}\n"
                 )
+                if cluster and cluster['count'] > 1:
+                    report += f"   🧩 Muammo #{cluster['id']}: {cluster['count']} ta murojaat, {len(cluster['groups'])} ta MFY\n"
+                report += "\n"
         else:
             report += "✅ Dolzarb muammo topilmadi.\n\n"
         
+        # Complaints about the same problem, clustered across groups on ingestion
+        if leaders.get('complaint_clusters'):
+            report += "🧩 TAKRORLANAYOTGAN MUAMMOLAR:\n"
+            for i, cluster in enumerate(leaders['complaint_clusters'], 1):
+                report += format_cluster(i, cluster)
+        
         # Aggressive Behavior Detection
         report += "💢 AGRESSIV XULOSALAR:\n"
-        aggressive_keywords = ['jinni', 'xun', 'o\'ldir', 'ur', 'tajovuz', 'hujum', 'tirnamay', 'soqov', 'g\'azab']
+        aggressive_keywords = analyzer.aggressive_keywords
         aggressive_messages = []
+        seen_aggressive = set()
         
-        for group_name, messages in group_messages.items():
+        for group_name, messages in messages_by_group.items():
             for msg in messages:
-                text = msg.get('text', '').lower()
-                if any(keyword in text for keyword in aggressive_keywords):
+                if aggressive_keywords.any(normalized(msg)):
+                    dup_key = msg.get('dup_key')
+                    if dup_key is not None:
+                        if dup_key in seen_aggressive:
+                            continue
+                        seen_aggressive.add(dup_key)
                     aggressive_messages.append({
                         'text': msg.get('text', ''),
                         'sender': msg.get('sender', 'Noma\'lum'),
                         'group_name': group_name,
+                        'dup_groups': msg.get('dup_groups'),
                         'timestamp': msg.get('timestamp', '')
                     })
         
@@ -353,7 +952,7 @@ async def generate_government_report():
             for i, msg in enumerate(aggressive_messages[:5], 1):  # Top 5 aggressive messages
                 report += (
                     f"{i}. \"{msg.get('text', '')[:80]}...\"\n"
-                    f"   📍 MFY: {msg.get('group_name', 'Noma\'lum')}\n"
+                    f"   📍 MFY: {format_group_names(msg)}\n"
                     f"   👤 Muallif: {msg.get('sender', 'Noma\'lum')}\n"
                     f"   ⏰ Vaqt: {msg.get('timestamp', '')[:16]}\n\n"
                 )
@@ -369,7 +968,11 @@ async def generate_government_report():
         
         report += "\n" + "="*50 + "\n"
         report += "📊 BU HISOBOT SUN'IY INTELLEKT TOMONIDAN TAYYORLANDI\n"
-        report += "🔄 Hisobot yangilanish chastotasi: Real vaqt\n"
+        # A snapshot can be served for hours: state when the data was taken, not "real time"
+        built_at = datetime.now()
+        report += f"🔄 Ma'lumotlar {built_at.strftime('%Y-%m-%d %H:%M')} holatiga ko'ra"
+        next_run = next_scheduled_run(built_at) if REPORT_SCHEDULE else None
+        report += f", keyingi yangilanish: {next_run.strftime('%H:%M')}\n" if next_run else "\n"
         
         return report
         
@@ -377,53 +980,328 @@ async def generate_government_report():
         logger.error(f"Error in generate_government_report: {str(e)}")
         return f"Hisobot yaratishda xatolik yuz berdi: {str(e)}"
 
-async def send_to_results_group(message):
+def build_period_report(days):
+    """
+    Weekly/monthly MFY report answered from the daily rollup tables
+    (no scan over raw messages)
+    """
+    message_store.flush()
+    until_day = datetime.now().date()
+    since_day = until_day - timedelta(days=days - 1)
+    groups = message_store.period_rollup(since_day.isoformat(), until_day.isoformat())
+    title = "HAFTALIK" if days == 7 else "OYLIK" if days == 30 else f"{days} KUNLIK"
+    
+    report = f"🏛️ {title} MFY HISOBOTI\n"
+    report += "=====================================\n"
+    report += f"📅 Davr: {since_day.isoformat()} — {until_day.isoformat()}\n\n"
+    if not groups:
+        return report + "📊 Bu davr uchun ma'lumot yo'q.\n"
+    
+    total_messages = sum(g['messages'] for g in groups.values())
+    report += "📈 UMUMIY STATISTIKA:\n"
+    report += f"🏢 Faol MFY guruhlari: {len(groups)} ta\n"
+    report += f"💬 Jami xabarlar: {total_messages} ta\n"
+    report += f"👥 Faol foydalanuvchilar: {message_store.period_distinct_senders(since_day.isoformat(), until_day.isoformat())} ta\n"
+    report += f"⚠️ Shikoyatlar: {sum(g['complaints'] for g in groups.values())} ta\n"
+    report += f"💢 Agressiv xabarlar: {sum(g['aggression_hits'] for g in groups.values())} ta\n\n"
+    
+    topic_totals = defaultdict(int)
+    for g in groups.values():
+        for topic, count in g['topics'].items():
+            topic_totals[topic] += count
+    if topic_totals:
+        report += "🏷️ ASOSIY MAVZULAR:\n"
+        for topic, count in sorted(topic_totals.items(), key=lambda x: x[1], reverse=True)[:5]:
+            report += f"- {topic}: {count} ta xabar\n"
+        report += "\n"
+    
+    report += "🚨 ENG KO'P SHIKOYAT TUSHGAN MFYLAR:\n"
+    by_complaints = sorted(groups.items(), key=lambda x: x[1]['complaints'], reverse=True)[:5]
+    for i, (group_name, g) in enumerate(by_complaints, 1):
+        report += (
+            f"{i}. 🏘️ {group_name}\n"
+            f"   ⚠️ Shikoyatlar: {g['complaints']} ta • 💬 {g['messages']} xabar • 👥 {g['senders']} kishi\n"
+            f"   📊 O'rtacha kayfiyat: {g['avg_sentiment']:+.2f}\n\n"
+        )
+    return report
+
+def current_leaders(max_age=86400):
     """
-    Send a message to the results group
+    Top groups and senders today, the most critical complaints of the last `max_age`
+    seconds (one per complaint cluster) and the largest complaint clusters
     """
-    # First try to find the group by username
+    today = leaders_for(datetime.now().date().isoformat())
+    cutoff = time.time() - max_age
+    critical = []
+    seen_clusters = set()
+    for score, complaint in sorted(
+        (entry for leaders in daily_leaders.values() for entry in leaders['complaints'].items()
+         if entry[1].epoch >= cutoff),
+        key=lambda entry: entry[0], reverse=True,
+    ):
+        if complaint.cluster_id is not None:
+            if complaint.cluster_id in seen_clusters:
+                continue
+            seen_clusters.add(complaint.cluster_id)
+        critical.append((score[0], complaint, complaint_clusters.summary(complaint.cluster_id)))
+        if len(critical) == CRITICAL_COMPLAINTS_KEPT:
+            break
+    return {
+        'top_groups': today['groups'].top(3),
+        'top_senders': [(today['senders'].label(sender), count) for sender, count in today['senders'].top(5)],
+        'critical_complaints': critical,
+        'complaint_clusters': complaint_clusters.top(CLUSTERS_IN_REPORT, since=cutoff),
+    }
+
+def take_report_snapshot():
+    """
+    Copy the in-memory state the report reads; cheap enough to run on the event loop.
+    Spilled groups are only listed (their files) and read by read_spilled_groups() in the worker.
+    """
+    messages_by_group = {name: list(messages) for name, messages in group_messages.hot_items()}
+    stats_by_group = {
+        name: dict(stats, activity=stats['activity'].copy(),
+                   active_users={day: sketch.copy() for day, sketch in stats['active_users'].items()})
+        for name, stats in group_stats.hot_items()
+    }
+    spilled = (group_messages.spilled_files(), group_stats.spilled_files())
+    return messages_by_group, stats_by_group, current_leaders(), spilled
+
+def read_spilled_groups(messages_by_group, stats_by_group, spilled):
+    """Add the spilled groups to a snapshot (runs in the report worker: disk reads and unpickling)"""
+    spilled_messages, spilled_stats = spilled
+    for name, messages in group_messages.read_spilled(spilled_messages):
+        messages_by_group[name] = list(messages)
+    for name, stats in group_stats.read_spilled(spilled_stats):
+        stats_by_group[name] = stats
+
+async def build_report_off_loop(with_group_analyses=False):
+    """Build the report in the worker thread and publish it as the latest snapshot"""
+    global report_in_flight
     try:
-        entity = await client.get_entity(RESULTS_GROUP)
-        await client.send_message(entity=entity, message=message)
-        return
+        messages_by_group, stats_by_group, leaders, spilled = take_report_snapshot()
+        totals_by_group = await collect_daily_totals()
+        loop = asyncio.get_running_loop()
+        started = datetime.now()
+        await loop.run_in_executor(report_executor, read_spilled_groups, messages_by_group, stats_by_group, spilled)
+        report = await loop.run_in_executor(report_executor, build_government_report,
+                                            messages_by_group, stats_by_group, leaders, totals_by_group)
+        group_reports = None
+        if with_group_analyses:
+            group_reports = await loop.run_in_executor(report_executor, analyze_all_groups, messages_by_group)
+        
+        latest_report['text'] = report
+        latest_report['generated_at'] = started
+        latest_report['version'] += 1
+        latest_report['group_reports'] = group_reports
+        logger.info(f"Government report v{latest_report['version']} built in "
+                    f"{(datetime.now() - started).total_seconds():.2f}s")
+        await loop.run_in_executor(report_executor, save_report_snapshot, dict(latest_report))
+        return report
+    finally:
+        report_in_flight = None
+
+def next_scheduled_run(now):
+    """Next datetime after `now` that matches REPORT_SCHEDULE"""
+    for day_offset in (0, 1):
+        day = now.date() + timedelta(days=day_offset)
+        for hour, minute in REPORT_SCHEDULE:
+            run_at = datetime(day.year, day.month, day.day, hour, minute)
+            if run_at > now:
+                return run_at
+    return None
+
+def format_report_age(generated_at):
+    """Human readable age of a report, e.g. '5 daqiqa oldin'"""
+    minutes = int((datetime.now() - generated_at).total_seconds() // 60)
+    if minutes < 1:
+        return "hozirgina"
+    if minutes < 60:
+        return f"{minutes} daqiqa oldin"
+    return f"{minutes // 60} soat {minutes % 60} daqiqa oldin"
+
+def save_report_snapshot(snapshot):
+    """Write a versioned report snapshot and prune the oldest ones"""
+    try:
+        os.makedirs(REPORT_SNAPSHOT_DIR, exist_ok=True)
+        name = f"report_v{snapshot['version']:06d}_{snapshot['generated_at'].strftime('%Y%m%d_%H%M%S')}.json"
+        data = dict(snapshot, generated_at=snapshot['generated_at'].isoformat())
+        with open(os.path.join(REPORT_SNAPSHOT_DIR, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        
+        snapshots = sorted(f for f in os.listdir(REPORT_SNAPSHOT_DIR) if f.startswith('report_v'))
+        for old_name in snapshots[:-REPORT_SNAPSHOT_KEEP]:
+            os.remove(os.path.join(REPORT_SNAPSHOT_DIR, old_name))
     except Exception as e:
-        logger.warning(f"Could not find group by username, trying by title: {str(e)}")
+        logger.warning(f"Could not save report snapshot: {str(e)}")
+
+def load_latest_report_snapshot():
+    """Restore the newest report snapshot from disk after a restart"""
+    try:
+        snapshots = sorted(f for f in os.listdir(REPORT_SNAPSHOT_DIR) if f.startswith('report_v'))
+        if not snapshots:
+            return
+        with open(os.path.join(REPORT_SNAPSHOT_DIR, snapshots[-1]), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        latest_report.update(data, generated_at=datetime.fromisoformat(data['generated_at']))
+        logger.info(f"Loaded report snapshot v{latest_report['version']} from {data['generated_at']}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not load report snapshot: {str(e)}")
+
+async def report_scheduler():
+    """Build report snapshots at the REPORT_SCHEDULE times"""
+    global report_in_flight
+    while True:
+        run_at = next_scheduled_run(datetime.now())
+        logger.info(f"Next scheduled report at {run_at.strftime('%Y-%m-%d %H:%M')}")
+        await asyncio.sleep(max(0, (run_at - datetime.now()).total_seconds()))
+        try:
+            if report_in_flight is None:
+                report_in_flight = asyncio.ensure_future(build_report_off_loop(with_group_analyses=REPORT_SCHEDULE_AI))
+            await asyncio.shield(report_in_flight)
+        except Exception as e:
+            logger.error(f"Scheduled report failed: {str(e)}")
+
+async def generate_government_report(max_age=None):
+    """
+    Return the government report.
+    A report younger than max_age seconds (REPORT_MAX_AGE by default) is served
+    as-is; otherwise one is built in a worker thread, and concurrent callers
+    share that single in-flight build.
+    """
+    global report_in_flight
+    if max_age is None:
+        max_age = REPORT_MAX_AGE
+    if latest_report['text'] and (datetime.now() - latest_report['generated_at']).total_seconds() <= max_age:
+        return latest_report['text']
     
-    # If that fails, try to find by title in dialogs
+    if report_in_flight is None:
+        report_in_flight = asyncio.ensure_future(build_report_off_loop())
+    # Shield so one cancelled waiter does not cancel the build for everyone else
+    return await asyncio.shield(report_in_flight)
+
+def print_unsent_message(message, error):
+    """Print a message that could not be sent, as a last resort"""
+    print("\n" + "="*50)
+    print("COULD NOT SEND TO TELEGRAM GROUP. MESSAGE CONTENT:")
+    print("="*50)
+    print(message)
+    print("="*50 + "\n")
+
+def handle_send_failure(message, error):
+    """Outbound sender gave up on a chunk: forget the (possibly stale) entity and print it"""
+    global results_group_entity
+    results_group_entity = None
+    print_unsent_message(message, error)
+
+# Outbound queue: smart chunking, per-chat/global pacing, FloodWait handling (created by setup())
+outbound = None
+
+async def send_to_results_group(message):
+    """
+    Queue a message for the results group; returns one future per chunk
+    """
+    global results_group_entity
     try:
-        dialogs = await client.get_dialogs()
-        for dialog in dialogs:
-            if hasattr(dialog.entity, 'title') and dialog.entity.title == RESULTS_GROUP:
-                await client.send_message(dialog.entity, message)
-                return
-        
-        # If still not found, try to send to the first available group
-        for dialog in dialogs:
-            if hasattr(dialog.entity, 'title'):
-                await client.send_message(dialog.entity, f"[Test] Sending to {dialog.entity.title}:\n{message}")
-                logger.info(f"Sent test message to {dialog.entity.title}")
-                break
-                
+        entity = results_group_entity or await resolve_results_group()
+        if entity is None:
+            raise ValueError(f"No group available to send to (looking for '{RESULTS_GROUP}')")
+        if results_group_is_fallback:
+            message = f"[Test] Sending to {entity.title}:\n{message}"
+        return outbound.enqueue(entity, message)
     except Exception as e:
         logger.error(f"Error sending message to any group: {str(e)}")
-        # Print to console as last resort
-        print("\n" + "="*50)
-        print("COULD NOT SEND TO TELEGRAM GROUP. MESSAGE CONTENT:")
-        print("="*50)
-        print(message)
-        print("="*50 + "\n")
+        # The cached entity may be stale; resolve it again next time
+        results_group_entity = None
+        print_unsent_message(message, e)
+        return []
 
-# Register event handler
-client.add_event_handler(handler, events.NewMessage())
+def setup():
+    """
+    Create the process-wide resources: logging, the Telegram client with its
+    event handlers, the message store and the outbound queue. Called by main()
+    rather than on import, so importing this module stays cheap and side-effect
+    free (shard and fallback worker processes re-import it under spawn).
+    """
+    global client, message_store, outbound
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("telegram_monitor.log"),
+            logging.StreamHandler()
+        ]
+    )
+    
+    # Create Telegram client
+    client = TelegramClient('session_name', API_ID, API_HASH)
+    
+    message_store = MessageStore(MESSAGE_DB_PATH)
+    analyzer.message_store = message_store
+    outbound = OutboundSender(client, on_failure=handle_send_failure)
+    
+    # Register event handler
+    # Filter in the event builder so private chats, channels and the account's own messages never
+    # reach the handler; own messages are still accepted when they are report commands
+    client.add_event_handler(handler, events.NewMessage(chats=MONITORED_CHAT_IDS or None, incoming=True,
+                                                        func=is_monitored_group))
+    client.add_event_handler(handler, events.NewMessage(chats=MONITORED_CHAT_IDS or None, outgoing=True,
+                                                        pattern=REPORT_COMMAND_PATTERN, func=is_monitored_group))
+
+background_tasks = set()  # Long-running tasks started by main(), kept referenced until they finish
+
+def start_background_task(coro):
+    """Run a coroutine as a background task that is kept alive and whose failure is logged"""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_task_done)
+    return task
+
+def background_task_done(task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_coro().__name__} failed: {str(task.exception())}")
 
 async def main():
     """
     Main function to start the Telegram client
     """
+    global shard_pool, catchup_running
+    setup()
+    
+    # Load persisted state before the client starts dispatching updates, so live
+    # messages never see (or overwrite) state that is loaded later
+    group_messages.clear_spill()
+    group_stats.clear_spill()
+    load_invite_links()
+    load_latest_report_snapshot()
+    load_checkpoints()
+    complaint_clusters.load(COMPLAINT_CLUSTERS_FILE)
+    # Live messages received while starting up mark where each group's catch-up stops
+    catchup_running = bool(catchup_targets)
+    if MONITOR_SHARDS > 1:
+        shard_pool = ShardedClassifier(MONITOR_SHARDS, on_shard_features)
+        shard_pool.start()
+    
     # Start the client
     await client.start(phone=PHONE)
     logger.info("Telegram client started")
     
+    try:
+        await warm_entity_cache()
+    except Exception as e:
+        logger.warning(f"Could not warm entity cache: {str(e)}")
+    start_background_task(catch_up_missed_messages())
+    start_background_task(refresh_entity_cache_periodically())
+    if REPORT_SCHEDULE:
+        start_background_task(report_scheduler())
+    start_background_task(flush_messages_periodically())
+    start_background_task(evict_idle_groups_periodically())
+    start_background_task(save_clusters_periodically())
+    
     # Print instructions
     print("🏛️ DAVLAT HOLOATI MONITORING MARKAZI")
     print("="*40)
@@ -434,7 +1312,24 @@ async def main():
     print("🛑 Press Ctrl+C to stop.")
     
     # Run the client until disconnected
-    await client.run_until_disconnected()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        if shard_pool is not None:
+            await shard_pool.drain()
+        tasks = list(background_tasks) + list(sender_lookups.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if shard_pool is not None:
+            shard_pool.close()
+        analyzer.close_fallback_pool()
+        try:
+            message_store.flush()
+            save_checkpoints()
+        except Exception as e:
+            logger.error(f"Could not write messages to the store, checkpoints not saved: {str(e)}")
+        complaint_clusters.save(COMPLAINT_CLUSTERS_FILE)
 
 if __name__ == "__main__":
     try:
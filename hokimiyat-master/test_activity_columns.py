@@ -0,0 +1,44 @@
+import random
+import time
+from datetime import datetime
+from group_analyzer import analyzer
+from activity_columns import ActivityColumns, np
+from message_records import MessageRecord, group_ref
+
+# Activity statistics: per-message loop vs one vectorized pass over all groups
+rng = random.Random(7)
+now = int(time.time())
+groups = {}
+for g in range(300):
+    ref = group_ref(f"MFY {g}", g)
+    groups[ref.name] = [MessageRecord("x" * rng.randint(1, 300), f"User {rng.randint(0, 30)}", None, ref,
+                                      now - rng.randint(0, 3 * 86400), id=i)
+                        for i in range(rng.randint(0, 400))]
+# Message dicts with ISO timestamps work too
+groups["Dict group"] = [{'text': "salom" * (i % 7), 'sender': f"User {i % 3}",
+                         'timestamp': datetime.fromtimestamp(now - i * 900).isoformat()} for i in range(50)]
+
+start = time.perf_counter()
+looped = {name: analyzer.analyze_group_activity(messages) for name, messages in groups.items()}
+loop_time = time.perf_counter() - start
+
+if np is None:
+    # NumPy is optional: without it the analyzer keeps its per-message loop
+    print(f"NumPy not installed: columnar path skipped (loop: {loop_time * 1000:.1f} ms)")
+    raise SystemExit
+
+start = time.perf_counter()
+columns = ActivityColumns.from_groups(groups)
+build_time = time.perf_counter() - start
+start = time.perf_counter()
+vectorized = columns.activity()
+compute_time = time.perf_counter() - start
+
+print(f"Messages: {len(columns)} in {len(groups)} groups")
+print("Results match:", vectorized == looped)
+print(f"Loop: {loop_time * 1000:.1f} ms")
+print(f"Columnar: {(build_time + compute_time) * 1000:.1f} ms "
+      f"(build {build_time * 1000:.1f} ms + compute {compute_time * 1000:.1f} ms), "
+      f"{loop_time / (build_time + compute_time):.1f}x faster")
+print("Single group batch:", analyzer.analyze_group_activity(ActivityColumns.from_groups({"MFY 1": groups["MFY 1"]}))
+      == looped["MFY 1"])
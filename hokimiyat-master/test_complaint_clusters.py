@@ -0,0 +1,39 @@
+import os
+import tempfile
+from group_analyzer import analyzer
+from complaint_clusters import ComplaintClusters
+
+def add(clusters, text, group, epoch=1000):
+    """Cluster a complaint the way the monitor does, with the topics its classification finds"""
+    topics = analyzer.classify_message(text)['topics']
+    return clusters.add({'text': text, 'group_name': group, 'epoch': epoch}, topics)
+
+# Complaints from different groups about the same problem join one tracked issue
+clusters = ComplaintClusters()
+complaints = [
+    ("Navoiy ko'chasida katta chuqur bor, mashinalar buzilyapti", "MFY 1"),
+    ("Навоий кўчасидаги чуқур ҳалигача тузатилмаган!", "MFY 2"),
+    ("Navoiy ko'chasi chuqur, avtobus o'tolmayapti, iltimos ta'mirlang", "MFY 3"),
+    ("Gulzor ko'chasida katta chuqur bor, mashinalar buzilyapti", "MFY 4"),
+    ("Navoiy ko'chasida 3 kundan beri suv yo'q", "MFY 5"),
+    ("3 kundan beri suv yo'q, muammo hal qilinmayapti", "MFY 6"),
+    ("Suv yo'q 3 kundan beri, qachon hal bo'ladi muammo", "MFY 7"),
+]
+ids = [add(clusters, text, group, 1000 + i) for i, (text, group) in enumerate(complaints)]
+print("Cluster ids:", ids)
+print("Navoiy pothole complaints together (extra topic too):", ids[0] == ids[1] == ids[2])
+print("Same wording, other street kept apart:", ids[3] != ids[0])
+print("Other problem on the same street kept apart:", ids[4] != ids[0])
+print("Water complaints together:", ids[5] == ids[6])
+for cluster in clusters.top():
+    print(f"  #{cluster['id']} x{cluster['count']} {cluster['groups']}: {cluster['text']}")
+print("Metrics:", clusters.metrics())
+
+# Ids survive a restart
+path = os.path.join(tempfile.mkdtemp(), "complaint_clusters.json")
+clusters.save(path)
+restored = ComplaintClusters()
+restored.load(path)
+again = add(restored, "Navoiy ko'chasidagi chuqurni tuzating", "MFY 8", 2000)
+print("After reload joins the same issue:", again == ids[0], "| count:", restored.get(again)['count'])
+print("New issues continue the numbering:", add(restored, "Maktab isitilmayapti", "MFY 9", 2000) > max(ids))
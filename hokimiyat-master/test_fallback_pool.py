@@ -0,0 +1,45 @@
+import os
+import time
+from group_analyzer import analyzer
+from message_records import MessageRecord, group_ref
+
+# City-wide fallback analysis: serial vs process pool
+texts = [
+    "Assalomu alaykum, ko'chamizda suv yo'q, iltimos zudlik bilan yordam bering",
+    "Bugun maktabda tadbir bo'ldi, rahmat ustozlarga",
+    "Yo'l ta'mirlanmagan, transport qatnovi yomon, muammo hal qilinmayapti",
+    "Gaz va elektr uzilishi haqida e'lon",
+]
+now = int(time.time())
+groups = {}
+for g in range(300):
+    ref = group_ref(f"MFY {g}", g)
+    groups[ref.name] = [MessageRecord(texts[i % len(texts)] + f" {i}", f"User {i % 40}", i % 40, ref, now - i * 60, id=i)
+                        for i in range(200)]
+
+def summary(results):
+    return {name: (len(r['issues']), r['sentiment_score'], r['topics'], len(r['complaints']),
+                   r['activity'], r['report'].split('\n', 1)[1].split('\n', 1)[1])
+            for name, r in results.items()}
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    serial = analyzer.analyze_groups_fallback(groups, workers=1)
+    serial_time = time.perf_counter() - start
+    print(f"Serial: {len(groups) / serial_time:.0f} groups/s")
+    
+    for workers in (2, 4, 8):
+        if workers > (os.cpu_count() or 1):
+            print(f"Only {os.cpu_count()} CPU(s), skipping {workers} workers")
+            break
+        analyzer.get_fallback_pool(workers).submit(int).result()  # Start the workers outside the timing
+        start = time.perf_counter()
+        pooled = analyzer.analyze_groups_fallback(groups, workers=workers)
+        pool_time = time.perf_counter() - start
+        print(f"{workers} workers: {len(groups) / pool_time:.0f} groups/s ({serial_time / pool_time:.1f}x)")
+        print("Results match serial:", summary(pooled) == summary(serial))
+    analyzer.close_fallback_pool()
+    
+    # Analyses run on isolated state, so the shared analyzer's issue list is untouched
+    print("Shared issues untouched:", analyzer.issues == [])
+    print("Categories merged:", sorted(analyzer.issue_categories))
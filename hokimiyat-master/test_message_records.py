@@ -0,0 +1,59 @@
+import time
+import tracemalloc
+from datetime import datetime
+from message_records import MessageRecord, group_ref
+from group_analyzer import analyzer
+
+# Compare memory per stored message: message dicts vs compact records
+COUNT = 20000
+now = time.time()
+
+def message_fields(i):
+    # Fresh strings per message, as Telethon delivers them
+    group_name = "".join(['MFY ', str(i % 200), ' guruhi'])
+    sender = "".join(['Foydalanuvchi ', str(i % 500)])
+    text = f"Xabar {i}: ko'chada chiroqlar yonmayapti, muammo hal qilinmadi"
+    return group_name, sender, text
+
+tracemalloc.start()
+before = tracemalloc.get_traced_memory()[0]
+dicts = []
+for i in range(COUNT):
+    group_name, sender, text = message_fields(i)
+    dicts.append({
+        'text': text,
+        'sender': sender,
+        'sender_id': 1000 + i % 500,
+        'group_name': group_name,
+        'group_id': -100 - i % 200,
+        'group_link': "".join(['https://t.me/c/', str(100 + i % 200)]),
+        'timestamp': datetime.fromtimestamp(now + i).isoformat(),
+        'id': i,
+        'is_forwarded': False,
+        'reply_to_msg_id': None,
+    })
+dict_bytes = tracemalloc.get_traced_memory()[0] - before
+
+before = tracemalloc.get_traced_memory()[0]
+records = []
+for i in range(COUNT):
+    group_name, sender, text = message_fields(i)
+    records.append(MessageRecord(
+        text=text,
+        sender=sender,
+        sender_id=1000 + i % 500,
+        group=group_ref(group_name, -100 - i % 200, f"https://t.me/c/{100 + i % 200}"),
+        epoch=now + i,
+        id=i,
+    ))
+record_bytes = tracemalloc.get_traced_memory()[0] - before
+tracemalloc.stop()
+
+print(f"Message dict: {dict_bytes / COUNT:.0f} bytes per message")
+print(f"MessageRecord: {record_bytes / COUNT:.0f} bytes per message")
+
+# The analyzer works on records directly
+sample = records[:300]
+print(f"Dict-style access: {sample[0]['group_name']}, {sample[0].get('timestamp')[:16]}")
+print(f"Activity matches: {analyzer.analyze_group_activity(sample) == analyzer.analyze_group_activity(dicts[:300])}")
+print(f"Complaints found: {len(analyzer.detect_complaints(sample))}")
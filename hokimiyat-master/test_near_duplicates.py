@@ -0,0 +1,23 @@
+import time
+from near_duplicates import NearDuplicateIndex
+
+# Test near-duplicate tagging across groups
+index = NearDuplicateIndex()
+
+announcement = "Hurmatli aholi! Ertaga soat 10:00 dan 16:00 gacha mahallamizda elektr energiyasi o'chiriladi."
+key1 = index.add(('MFY 1', 1), announcement, 'MFY 1')
+key2 = index.add(('MFY 2', 7), "Fwd: " + announcement, 'MFY 2')
+key3 = index.add(('MFY 3', 4), announcement + " Iltimos, tayyor turing!", 'MFY 3')
+key4 = index.add(('MFY 3', 5), "Bugun maktab oldidagi yo'l ta'mirlanmagan, bolalar qiynalmoqda", 'MFY 3')
+
+print(f"Forwarded copies share one key: {key1 == key2 == key3}")
+print(f"Groups: {index.groups(key1)}, seen {index.count(key1)} times")
+print(f"Different message gets its own key: {key4 != key1}")
+print(f"Short message is not deduplicated: {index.add(('MFY 1', 9), 'rahmat', 'MFY 1') == ('MFY 1', 9)}")
+
+# Rough ingestion speed
+start = time.perf_counter()
+for i in range(5000):
+    index.add(('bench', i), f"Xabar {i}: ko'chadagi chiroqlar {i % 50} kundan beri yonmayapti, iltimos yordam bering", f"MFY {i % 100}")
+elapsed = time.perf_counter() - start
+print(f"Average add time: {elapsed / 5000 * 1000:.3f} ms, stats: {index.stats}")
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import random
+import time
+from complaint_clusters import ComplaintClusters
+from near_duplicates import NearDuplicateIndex
+from sharding import DailyAggregator, ShardedClassifier, shard_for
+from group_analyzer import analyzer
+from text_normalizer import normalize
+
+# Per-message throughput (normalize, near-duplicate check, classify, cluster complaints):
+# in-process vs sharded worker processes, and the work left on the coordinator
+texts = [
+    "Assalomu alaykum, ko'chamizda suv yo'q, iltimos zudlik bilan yordam bering",
+    "Bugun maktabda tadbir bo'ldi, rahmat ustozlarga",
+    "Yo'l ta'mirlanmagan, transport qatnovi yomon, muammo hal qilinmayapti",
+    "Gaz va elektr uzilishi haqida e'lon",
+]
+# Distinct wording per message, plus every 10th message reposted in another group
+rng = random.Random(7)
+words = ["ko'cha", "uy", "mahalla", "bola", "kecha", "ertaga", "hokim", "rais", "chiroq", "suv", "quvur", "bozor",
+         "shifoxona", "avtobus", "bekat", "park", "daraxt", "axlat", "qish", "yoz", "pensiya", "ish", "bank", "xat"]
+bodies = [texts[i % len(texts)] + " " + " ".join(rng.choice(words) for _ in range(6)) + f" {i}" for i in range(40000)]
+messages = [((i % 300, i), f"MFY {i % 300}", time.time(), bodies[i - 5] if i % 10 == 9 else bodies[i])
+            for i in range(40000)]
+
+def merge_record(duplicates, clusters, key, group_name, text, features, duplicate_signature=None, cluster_sketch=None):
+    """What the coordinator does per message: match against the shared index and clusters"""
+    duplicates.add(key, text, group_name, duplicate_signature)
+    if features['complaint']:
+        clusters.add({'text': text, 'group_name': group_name}, features['topics'], features['priority'], cluster_sketch)
+
+async def run_sharded(shards):
+    done = asyncio.Event()
+    received = 0
+    coordinator_time = 0.0
+    duplicates = NearDuplicateIndex()
+    clusters = ComplaintClusters()
+    group_names = {key: group_name for key, group_name, _, _ in messages}
+    
+    def on_features(key, features, text, duplicate_signature, cluster_sketch):
+        nonlocal received, coordinator_time
+        start = time.thread_time()  # CPU time: the workers may share the cores with the coordinator
+        merge_record(duplicates, clusters, key, group_names[key], text, features, duplicate_signature, cluster_sketch)
+        coordinator_time += time.thread_time() - start
+        received += 1
+        if received == len(messages):
+            done.set()
+    
+    pool = ShardedClassifier(shards, on_features, batch_size=200)
+    pool.start()
+    await pool.collect()  # Wait for the workers to start
+    start = time.perf_counter()
+    for message in messages:
+        pool.submit(*message)
+    pool.flush()
+    await done.wait()
+    rate = len(messages) / (time.perf_counter() - start)
+    totals = await pool.collect()
+    pool.close()
+    return rate, totals, coordinator_time / len(messages), duplicates.stats['duplicates']
+
+if __name__ == "__main__":
+    start, start_cpu = time.perf_counter(), time.thread_time()
+    aggregator = DailyAggregator()
+    duplicates = NearDuplicateIndex()
+    clusters = ComplaintClusters()
+    for key, group_name, epoch, text in messages:
+        text = normalize(text)
+        features = analyzer.classify_message(text)
+        aggregator.add(group_name, epoch, features)
+        merge_record(duplicates, clusters, key, group_name, text, features)
+    inline_rate = len(messages) / (time.perf_counter() - start)
+    inline_time = (time.thread_time() - start_cpu) / len(messages)
+    print(f"In-process: {inline_rate:.0f} msg/s ({inline_time * 1e6:.0f} µs CPU per message)")
+    
+    for shards in (1, 2, 4):
+        if shards > (os.cpu_count() or 1):
+            break
+        rate, totals, merge_time, dups = asyncio.run(run_sharded(shards))
+        same = sum(t['complaints'] for t in totals.values()) == sum(t['complaints'] for t in aggregator.day(time.strftime('%Y-%m-%d')).values())
+        print(f"{shards} shard(s): {rate:.0f} msg/s ({rate / inline_rate:.2f}x), coordinator {merge_time * 1e6:.0f} µs "
+              f"CPU per message ({merge_time / inline_time:.0%} of in-process), totals match: {same}, "
+              f"duplicates match: {dups == duplicates.stats['duplicates']}")
+    
+    print(f"Groups per shard (4 shards): {[sum(1 for g in range(300) if shard_for(f'MFY {g}', 4) == s) for s in range(4)]}")
@@ -0,0 +1,44 @@
+import random
+import time
+from sketches import HyperLogLog, RollingCounter, SpaceSaving, TopK
+
+# Distinct users per group and city-wide, with people active in several groups
+groups = [HyperLogLog() for _ in range(20)]
+for user_id in range(20000):
+    for g in range(user_id % 3 + 1):
+        groups[(user_id + g * 7) % 20].add(user_id)
+
+city = HyperLogLog.union(groups)
+summed = sum(sketch.count() for sketch in groups)
+print(f"City-wide distinct users: {city.count()} (exact 20000, error bound ±{city.error:.1%})")
+print(f"Sum of per-group counts (double counts): {summed}")
+small = HyperLogLog()
+for user_id in range(37):
+    small.add(user_id)
+    small.add(user_id)
+print(f"Small group, 37 users each seen twice: {small.count()}")
+print(f"Memory per sketch: {len(small.registers)} bytes")
+
+# Heavy hitters and bounded top-K over a skewed stream
+rng = random.Random(1)
+groups = SpaceSaving(capacity=50)
+exact = {}
+for _ in range(100000):
+    group = f"MFY {min(int(rng.paretovariate(1.2)), 400)}"
+    groups.add(group)
+    exact[group] = exact.get(group, 0) + 1
+print(f"Space-Saving top 3: {groups.top(3)}")
+print(f"Exact top 3:        {sorted(exact.items(), key=lambda x: x[1], reverse=True)[:3]}")
+
+complaints = TopK(k=3)
+for i in range(10000):
+    complaints.add((i % 4, i), f"complaint {i}")
+print(f"Top 3 complaints by (priority, time): {[item for _, item in complaints.items()]}")
+
+# Rolling time windows without resets
+start = time.time() - 3 * 86400
+activity = RollingCounter()
+for minute in range(0, 3 * 24 * 60, 2):
+    activity.add(start + minute * 60)
+print(f"Rolling counter: last hour {activity.last_hour()}, last 7 days {activity.last_days(7)} (expected ~30 and 2160)")
+print(f"Memory per counter: {activity.counts.itemsize * activity.size + activity.bucket_ids.itemsize * activity.size} bytes")
@@ -0,0 +1,40 @@
+import time
+from group_analyzer import analyzer
+from message_records import MessageRecord, group_ref
+from text_normalizer import KeywordSet, normalize
+
+# Script and apostrophe variants normalize to the same text
+variants = ["Ko'chamizda suv yo'q, shikoyat qilamiz", "Koʻchamizda suv yoʻq, SHIKOYAT qilamiz",
+            "Ko‘chamizda suv yo’q, shikoyat qilamiz", "Кўчамизда сув йўқ, шикоят қиламиз"]
+print("Normalized:", normalize(variants[0]))
+print("All variants equal:", len({normalize(text) for text in variants}) == 1)
+print("All variants are complaints:", all(analyzer.classify_message(text)['complaint'] for text in variants))
+print("Cyrillic 'е' at word start:", normalize("Ер ва поезд"))
+
+# Keywords match at the start of a word, so 'ur' no longer matches inside 'yurak'
+aggressive = KeywordSet(['ur', "o'ldir"])
+print("'yurak' aggressive:", aggressive.any("yuragim og'riyapti"), "| 'urdi' aggressive:", aggressive.any("uni urdi"))
+
+# Keyword lists shrink once variants collapse; any() skips keywords implied by shorter ones
+complaints = KeywordSet(['shikoyat', 'шикоят', 'muammo', 'muammo bor', 'проблема', 'problema'])
+print("Keywords:", complaints.keywords, "| checked per message:", len(complaints.minimal))
+print(f"Analyzer complaint keywords: {len(analyzer.complaint_keywords)}, "
+      f"checked per message: {len(analyzer.complaint_keywords.minimal)}")
+
+# Each record is normalized once and reused by every analysis pass
+ref = group_ref("MFY 1", 1)
+texts = ["Yo'l ta'mirlanmagan, muammo hal qilinmayapti", "Рахмат, яхши иш бўлди", "Gaz yo'q, zudlik bilan yordam bering"]
+messages = [MessageRecord(texts[i % 3] + f" {i}", f"User {i % 20}", i % 20, ref, time.time() - i, id=i)
+            for i in range(20000)]
+normalize.cache_clear()
+start = time.perf_counter()
+for msg in messages:
+    analyzer.classify_message(msg)
+first = time.perf_counter() - start
+start = time.perf_counter()
+analyzer.detect_complaints(messages)
+analyzer.detect_issues(messages)
+second = time.perf_counter() - start
+print(f"Normalizations: {normalize.cache_info().misses} for {len(messages)} messages")
+print(f"Classify (normalizes): {first * 1e6 / len(messages):.1f} us/msg, "
+      f"complaints + issues (reuses): {second * 1e6 / len(messages):.1f} us/msg")
@@ -0,0 +1,102 @@
+import re
+from functools import lru_cache
+
+WORD_RE = re.compile(r"\w+(?:'\w+)*")
+
+# Uzbek Cyrillic (and Russian) to Uzbek Latin; 'е' is handled separately (see transliterate)
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'ғ': "g'", 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'j',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'қ': 'q', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ў': "o'", 'ф': 'f', 'х': 'x', 'ҳ': 'h',
+    'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sh', 'ъ': "'", 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+}
+
+# Every apostrophe variant used in Uzbek Latin (o‘, gʻ, ta’lim, ...) becomes a plain '
+APOSTROPHES = "ʻʼ’‘`´ʹ′"
+
+TRANSLATION = str.maketrans({**CYRILLIC_TO_LATIN, **{char: "'" for char in APOSTROPHES}})
+CYRILLIC_RE = re.compile(r"[а-яёўқғҳ]")
+# 'е' is 'ye' at the start of a word and after a vowel or sign (ер -> yer, поезд -> poyezd)
+YE_RE = re.compile(r"(?:(?<=[аеёиоуўэюяъь])|(?<!\w))е")
+
+class NormalizedText(str):
+    """Text already normalized by normalize(): casefolded Latin tokens separated by single spaces"""
+    
+    __slots__ = ()
+    
+    def tokens(self):
+        return self.split()
+
+EMPTY = NormalizedText()
+
+def transliterate(text):
+    """Casefolded text with Cyrillic letters and apostrophe variants mapped to Uzbek Latin"""
+    if CYRILLIC_RE.search(text):
+        text = YE_RE.sub('ye', text)
+    return text.translate(TRANSLATION)
+
+@lru_cache(maxsize=4096)
+def normalize(text):
+    """
+    Casefold, transliterate Cyrillic to Latin, unify apostrophes and tokenize.
+    Keyword matching works on the result, so one keyword covers every script and spelling.
+    """
+    if not text:
+        return EMPTY
+    return NormalizedText(" ".join(WORD_RE.findall(transliterate(text.casefold()))))
+
+def normalized(value):
+    """
+    Normalized form of a text or message (dict or MessageRecord, which caches
+    its own); already normalized text is returned as is.
+    """
+    if isinstance(value, NormalizedText):
+        return value
+    if value is None:
+        return EMPTY
+    if isinstance(value, str):
+        return normalize(value)
+    cached = getattr(value, 'normalized', None)
+    if cached is not None:
+        return cached
+    return normalize(value.get('text') or '')
+
+def join_normalized(messages):
+    """Normalized text of several messages together"""
+    return NormalizedText(" ".join(text for text in map(normalized, messages) if text))
+
+class KeywordSet:
+    """
+    Keywords normalized like message text and deduplicated, so spelling and
+    script variants collapse into one entry. A keyword matches at the start
+    of a word (so suffixed forms match too: shikoyat -> shikoyatim), and
+    multi-word keywords match as a phrase.
+    """
+    
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(word for word in map(normalize, keywords) if word))
+        self.padded = tuple(' ' + word for word in self.keywords)
+        # For any(): keywords implied by a shorter one ('muammo bor' by 'muammo') are skipped
+        self.minimal = tuple(' ' + word for word in self.keywords
+                             if not any(other != word and word.startswith(other) for other in self.keywords))
+    
+    def __iter__(self):
+        return iter(self.keywords)
+    
+    def __len__(self):
+        return len(self.keywords)
+    
+    def found(self, text):
+        """Keywords present in a text"""
+        padded = ' ' + normalized(text)
+        return [word for word, key in zip(self.keywords, self.padded) if key in padded]
+    
+    def count(self, text):
+        """Number of distinct keywords present in a text"""
+        padded = ' ' + normalized(text)
+        return sum(1 for key in self.padded if key in padded)
+    
+    def any(self, text):
+        padded = ' ' + normalized(text)
+        return any(key in padded for key in self.minimal)